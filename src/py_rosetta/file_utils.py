@@ -0,0 +1,23 @@
+# file_utils.py
+
+'''Helpers shared by the tasks that keep results on disk.'''
+
+import os
+
+
+def replace_file(path, data):
+    '''Writes `data` (bytes) to `path` through a temporary file, so a crash
+       never leaves a half-written file behind. Returns None.'''
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as out:
+        out.write(data)
+    os.replace(temporary, path)
+
+
+def cache_path(name):
+    '''Takes one arg: `name` (str, a file name).
+       Returns the path for that file in the user's cache directory (str):
+       under $XDG_CACHE_HOME if set, else ~/.cache, in a py_rosetta folder.
+       The folder is not created.'''
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(root, 'py_rosetta', name)
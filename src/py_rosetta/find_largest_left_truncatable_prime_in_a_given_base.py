@@ -28,8 +28,470 @@ The task is to reconstruct as much, and possibly more, of the table in the OEIS
 as you are able.'''
 
 
-from primePy import primes
+import argparse
+import json
+import mmap
+import os
+import struct
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import chain
+from math import gcd, isqrt
+from time import perf_counter
+
+# Run as a script, this module has no package, so its neighbours are
+# imported as top-level modules from its directory.
+if __package__:
+    from .file_utils import replace_file
+else:
+    from file_utils import replace_file
 
 DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
 
 
+# Primality testing. Candidates in the larger bases run to dozens of
+# digits, far beyond trial division, so small numbers are looked up in a
+# sieve, larger ones are screened against the small primes with a single
+# gcd, and survivors get Miller-Rabin: deterministic below 2**64, using
+# the smallest known set of bases that suffices for the size of n, and
+# the Baillie-PSW test (a base-2 strong probable-prime test plus a strong
+# Lucas test) above that. No counterexample to Baillie-PSW is known.
+
+SIEVE_LIMIT = 1 << 16
+WHEEL_LIMIT = 2000
+MILLER_RABIN_BASES = (
+    (4_759_123_141, (2, 7, 61)),
+    (2_152_302_898_747, (2, 3, 5, 7, 11)),
+    (3_474_749_660_383, (2, 3, 5, 7, 11, 13)),
+    (341_550_071_728_321, (2, 3, 5, 7, 11, 13, 17)),
+    (1 << 64, (2, 325, 9375, 28178, 450775, 9780504, 1795265022)),
+)
+
+
+def sieve(limit):
+    '''Sieve of Eratosthenes.
+       Takes one arg: `limit` (int).
+       Returns a bytearray of length `limit` whose item i is 1 if i is prime
+       and 0 if not.'''
+    flags = bytearray([1]) * limit
+    flags[:2] = b'\x00\x00'
+    for p in range(2, isqrt(limit - 1) + 1):
+        if flags[p]:
+            flags[p*p::p] = bytes(len(range(p*p, limit, p)))
+    return flags
+
+
+SMALL_PRIME_FLAGS = sieve(SIEVE_LIMIT)
+SMALL_PRIMES = [p for p in range(SIEVE_LIMIT) if SMALL_PRIME_FLAGS[p]]
+WHEEL_PRODUCT = 1
+for p in SMALL_PRIMES:
+    if p >= WHEEL_LIMIT:
+        break
+    WHEEL_PRODUCT *= p
+del p
+
+
+def is_strong_probable_prime(n, a):
+    '''Miller-Rabin test of odd `n` > 2 to base `a`.
+       Takes two args: `n` (int) and `a` (int).
+       Returns False if `a` proves `n` composite, True otherwise.'''
+    d = n - 1
+    s = (d & -d).bit_length() - 1
+    d >>= s
+    x = pow(a, d, n)
+    if x == 1 or x == n - 1:
+        return True
+    for _ in range(s - 1):
+        x = x * x % n
+        if x == n - 1:
+            return True
+    return False
+
+
+def jacobi(a, n):
+    '''Jacobi symbol (a/n) for odd positive `n`.
+       Takes two args: `a` (int) and `n` (int).
+       Returns -1, 0 or 1.'''
+    a %= n
+    result = 1
+    while a:
+        while a % 2 == 0:
+            a //= 2
+            if n % 8 in (3, 5):
+                result = -result
+        a, n = n, a
+        if a % 4 == 3 and n % 4 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+
+def is_strong_lucas_probable_prime(n):
+    '''Strong Lucas test of odd `n` > 2, not a perfect square, with
+       Selfridge's parameters: D is the first of 5, -7, 9, -11, ... with
+       Jacobi symbol (D/n) = -1, P = 1 and Q = (1 - D)/4.
+       Takes one arg: `n` (int).
+       Returns False if `n` is proven composite, True otherwise.'''
+    D = 5
+    while True:
+        j = jacobi(D, n)
+        if j == -1:
+            break
+        if j == 0 and abs(D) != n:
+            return False
+        D = -D - 2 if D > 0 else -D + 2
+    P, Q = 1, (1 - D) // 4
+    d = n + 1
+    s = (d & -d).bit_length() - 1
+    d >>= s
+    # Walk the bits of d from the top, doubling the index k each step
+    # and adding one where the bit is set, keeping U_k, V_k and Q**k mod n.
+    U, V, Qk = 1, P, Q % n
+    for bit in bin(d)[3:]:
+        U = U * V % n
+        V = (V * V - 2 * Qk) % n
+        Qk = Qk * Qk % n
+        if bit == '1':
+            U, V = (P * U + V) % n, (D * U + P * V) % n
+            if U % 2:
+                U += n
+            if V % 2:
+                V += n
+            U, V = U // 2, V // 2
+            Qk = Qk * Q % n
+    if U == 0 or V == 0:
+        return True
+    for _ in range(s - 1):
+        V = (V * V - 2 * Qk) % n
+        Qk = Qk * Qk % n
+        if V == 0:
+            return True
+    return False
+
+
+def is_prime(n):
+    '''Primality test.
+       Takes one arg: `n` (int).
+       Returns True if `n` is prime and False if not. Exact below 2**64;
+       above that it is the Baillie-PSW test.'''
+    if n < SIEVE_LIMIT:
+        return n >= 0 and SMALL_PRIME_FLAGS[n] == 1
+    if gcd(n, WHEEL_PRODUCT) != 1:
+        return False
+    if n < 1 << 64:
+        for (limit, bases) in MILLER_RABIN_BASES:
+            if n < limit:
+                return all(is_strong_probable_prime(n, a) for a in bases)
+    if isqrt(n) ** 2 == n:
+        return False
+    return is_strong_probable_prime(n, 2) and is_strong_lucas_probable_prime(n)
+
+
+# The search. Every left-truncatable prime with k+1 digits is a digit d
+# placed in front of one with k digits, i.e. d * base**k + c, so the
+# primes are found a level (a digit count) at a time and only the
+# current level is ever held in memory.
+
+def compact(values):
+    '''Packs ints into an unsigned 64-bit array while they fit, and a list once
+       they don't.
+       Takes one arg: `values` (iterable of non-negative ints).
+       Returns an array.array or a list.'''
+    values = list(values)
+    try:
+        return array('Q', values)
+    except OverflowError:
+        return values
+
+
+def extend_level(frontier, power, base):
+    '''Takes three args:
+        `frontier` (sequence of the left-truncatable primes with k digits)
+        `power` (int, base**k)
+        `base` (int).
+       Returns the left-truncatable primes with k+1 digits, packed by `compact`.'''
+    steps = [d * power for d in range(1, base)]
+    return compact(n for step in steps for c in frontier if is_prime(n := step + c))
+
+
+def left_truncatable_prime_levels(base):
+    '''Generator.
+       Takes one arg: `base` (int > 2).
+       Yields, for k = 1, 2, ... until none are left, the left-truncatable
+       primes in `base` with k digits.'''
+    frontier = compact(p for p in range(2, base) if is_prime(p))
+    powers = [1, base]
+    while frontier:
+        yield frontier
+        frontier = extend_level(frontier, powers[-1], base)
+        powers.append(powers[-1] * base)
+
+
+def largest_left_truncatable_prime(base, progress=None):
+    '''Takes one arg, `base` (int > 2), and optionally `progress`, a function
+       called as progress(k, count) after each level with the digit count and
+       the number of primes found at that level.
+       Returns the largest left-truncatable prime in `base` (int).'''
+    last = None
+    for k, frontier in enumerate(left_truncatable_prime_levels(base), 1):
+        if progress is not None:
+            progress(k, len(frontier))
+        last = frontier
+    return max(last)
+
+
+def to_base(n, base):
+    '''Takes two args: `n` (non-negative int) and `base` (int from 2 to 36).
+       Returns the digits of `n` in `base` as a string.'''
+    digits = []
+    while True:
+        n, digit = divmod(n, base)
+        digits.append(DIGITS[digit])
+        if n == 0:
+            return ''.join(reversed(digits))
+
+
+# Checkpoints and the results cache. After each level, a base's frontier
+# is written to <checkpoint_dir>/base-<base>.ckpt. The file has a fixed
+# header, then the frontier sorted ascending and stored as the gaps
+# between neighbours, each gap a LEB128 varint. The gaps are small, so
+# most take a byte or two, and a reader can decode the values in one
+# pass straight out of a memory map. A finished base's answer goes into
+# <checkpoint_dir>/results.json and its checkpoint is deleted.
+
+CHECKPOINT_HEADER = struct.Struct('<4sIIQ')
+CHECKPOINT_MAGIC = b'LTP1'
+RESULTS_FILE = 'results.json'
+
+
+def checkpoint_path(checkpoint_dir, base):
+    '''Takes two args: `checkpoint_dir` (str) and `base` (int).
+       Returns the path of that base's checkpoint file (str).'''
+    return os.path.join(checkpoint_dir, f"base-{base}.ckpt")
+
+
+def encode_varints(values):
+    '''Takes one arg: `values` (iterable of non-negative ints).
+       Returns the gaps between the sorted values as LEB128 varints (bytes).'''
+    encoded = bytearray()
+    previous = 0
+    for value in sorted(values):
+        gap = value - previous
+        previous = value
+        while gap >= 0x80:
+            encoded.append(gap & 0x7F | 0x80)
+            gap >>= 7
+        encoded.append(gap)
+    return bytes(encoded)
+
+
+def decode_varints(buffer, offset, count):
+    '''Generator. The inverse of `encode_varints`.
+       Takes three args: `buffer` (bytes-like, e.g. an mmap), `offset` (int,
+       where the varints start) and `count` (int, how many to decode).
+       Yields the values in ascending order.'''
+    value = 0
+    for _ in range(count):
+        gap = shift = 0
+        while True:
+            byte = buffer[offset]
+            offset += 1
+            gap |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        value += gap
+        yield value
+
+
+def save_checkpoint(path, base, level, frontier):
+    '''Takes four args: `path` (str), `base` (int), `level` (int, the digit
+       count of the primes in `frontier`) and `frontier` (sequence of ints).
+       Returns None.'''
+    header = CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, base, level, len(frontier))
+    replace_file(path, header + encode_varints(frontier))
+
+
+def load_checkpoint(path):
+    '''Takes one arg: `path` (str) of a file written by `save_checkpoint`.
+       Returns a 3-tuple: base (int), level (int) and the frontier, packed by
+       `compact`.'''
+    with open(path, 'rb') as checkpoint, \
+         mmap.mmap(checkpoint.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        magic, base, level, count = CHECKPOINT_HEADER.unpack_from(buffer)
+        if magic != CHECKPOINT_MAGIC:
+            raise ValueError(f"{path} is not a truncatable-prime checkpoint")
+        frontier = compact(decode_varints(buffer, CHECKPOINT_HEADER.size, count))
+    return base, level, frontier
+
+
+def load_results(checkpoint_dir):
+    '''Takes one arg: `checkpoint_dir` (str).
+       Returns a dict mapping each finished base (int) to its largest
+       left-truncatable prime (int); empty if there is no results file.'''
+    try:
+        with open(os.path.join(checkpoint_dir, RESULTS_FILE)) as results:
+            return {int(base): largest for (base, largest) in json.load(results).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def save_results(checkpoint_dir, results):
+    '''Takes two args: `checkpoint_dir` (str) and `results` (dict as returned
+       by `load_results`). Returns None.'''
+    text = json.dumps({str(base): results[base] for base in sorted(results)}, indent=1)
+    replace_file(os.path.join(checkpoint_dir, RESULTS_FILE), text.encode())
+
+
+# The parallel driver. Levels within a base must be built in order, but
+# each level splits into independent chunks of its frontier, and
+# different bases are independent altogether. So every base in the run
+# keeps its chunks in flight on one shared process pool, and a base's
+# next level is assembled as soon as the last chunk of its current level
+# comes back. Small bases finish early and leave the workers to the
+# large ones. Since the bases share the workers, a base's time is the
+# sum of the time its own chunks spent in them, not the wall-clock time
+# to its finish, which would count the time it queued behind the others.
+
+CHUNK_SIZE = 1000
+
+
+def timed_extend_level(frontier, power, base):
+    '''Runs `extend_level` with the same args in a worker.
+       Returns a 2-tuple: its result, and the seconds it took (float).'''
+    start = perf_counter()
+    next_level = extend_level(frontier, power, base)
+    return next_level, perf_counter() - start
+
+
+class BaseSearch:
+    '''The state of one base in a parallel run: the current level and its digit
+       count, the power of the base that the next level's leading digits
+       multiply, the results of the chunks sent out so far, where to write
+       checkpoints (if anywhere), and the seconds its chunks have taken.'''
+
+    def __init__(self, base, checkpoint=None, resume=False):
+        self.base = base
+        self.checkpoint = checkpoint
+        if resume and checkpoint is not None and os.path.exists(checkpoint):
+            stored_base, self.level, self.frontier = load_checkpoint(checkpoint)
+            if stored_base != base:
+                raise ValueError(f"{checkpoint} is a checkpoint for base {stored_base}, not {base}")
+        else:
+            self.level = 1
+            self.frontier = compact(p for p in range(2, base) if is_prime(p))
+        self.power = base ** self.level
+        self.parts = []
+        self.outstanding = 0
+        self.seconds = 0.0
+
+    def submit(self, pool, chunk_size):
+        '''Sends the current level to `pool` in chunks of `chunk_size`.
+           Returns a list of (future, chunk number) pairs.'''
+        chunks = range(0, len(self.frontier), chunk_size)
+        self.parts = [None] * len(chunks)
+        self.outstanding = len(chunks)
+        return [(pool.submit(timed_extend_level, self.frontier[start:start + chunk_size],
+                             self.power, self.base), number)
+                for (number, start) in enumerate(chunks)]
+
+    def advance(self):
+        '''Assembles the next level from the returned chunks.
+           Returns True if it has any primes, and False if the current level
+           is the last.'''
+        next_level = compact(chain.from_iterable(self.parts))
+        if not next_level:
+            return False
+        self.frontier = next_level
+        self.level += 1
+        self.power *= self.base
+        if self.checkpoint is not None:
+            save_checkpoint(self.checkpoint, self.base, self.level, self.frontier)
+        return True
+
+
+def search_bases_in_parallel(bases, workers=None, chunk_size=CHUNK_SIZE,
+                             checkpoint_dir=None, resume=False):
+    '''Generator.
+       Takes one arg, `bases` (iterable of ints > 2), and optionally `workers`
+       (the number of processes; all CPUs by default), `chunk_size` (the
+       number of primes of a level given to a worker at a time),
+       `checkpoint_dir` (where to keep checkpoints and cached results) and
+       `resume` (whether to pick up unfinished bases from their checkpoints).
+       Yields (base, largest left-truncatable prime, seconds) as each base
+       finishes, where seconds is the time the base's chunks spent in the
+       workers, added up. Bases already in the results cache are yielded
+       first, with 0 seconds, and not searched again.'''
+    results = {}
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        results = load_results(checkpoint_dir)
+    with ProcessPoolExecutor(workers) as pool:
+        pending = {}
+        for base in bases:
+            if base in results:
+                yield base, results[base], 0.0
+                continue
+            checkpoint = None
+            if checkpoint_dir is not None:
+                checkpoint = checkpoint_path(checkpoint_dir, base)
+            search = BaseSearch(base, checkpoint, resume)
+            for (future, number) in search.submit(pool, chunk_size):
+                pending[future] = (search, number)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                search, number = pending.pop(future)
+                search.parts[number], seconds = future.result()
+                search.seconds += seconds
+                search.outstanding -= 1
+                if search.outstanding:
+                    continue
+                if search.advance():
+                    for (future, number) in search.submit(pool, chunk_size):
+                        pending[future] = (search, number)
+                else:
+                    largest = max(search.frontier)
+                    if checkpoint_dir is not None:
+                        results[search.base] = largest
+                        save_results(checkpoint_dir, results)
+                        if os.path.exists(search.checkpoint):
+                            os.remove(search.checkpoint)
+                    yield search.base, largest, search.seconds
+
+
+def truncatable_main(bases=range(3, 18), workers=None, checkpoint_dir=None, resume=False):
+    '''Prints the largest left-truncatable prime for each of `bases`, in decimal
+       and in its own base, with the worker time its search took, as the
+       bases finish, and then the wall-clock time of the whole run.
+       Takes four optional args: `bases` (iterable of ints > 2), `workers`
+       (number of processes; all CPUs by default), `checkpoint_dir` (str) and
+       `resume` (bool), as for `search_bases_in_parallel`.
+       Returns None.'''
+    start = perf_counter()
+    for (base, largest, elapsed) in search_bases_in_parallel(
+            bases, workers, checkpoint_dir=checkpoint_dir, resume=resume):
+        print(f"{base:>3} {largest:>40} {to_base(largest, base):>30} {elapsed:9.2f}s")
+    print(f"Total: {perf_counter() - start:.2f}s")
+
+
+def parse_args(argv=None):
+    '''Parses the command line (or `argv`, if given).
+       Returns an argparse.Namespace.'''
+    parser = argparse.ArgumentParser(
+        description="Find the largest left-truncatable prime in each of a range of bases.")
+    parser.add_argument('bases', type=int, nargs='*', default=list(range(3, 18)))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--checkpoint-dir', default=None,
+                        help="directory for per-level checkpoints and finished results")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue unfinished bases from their checkpoints")
+    args = parser.parse_args(argv)
+    if args.resume and args.checkpoint_dir is None:
+        parser.error("--resume needs --checkpoint-dir")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    truncatable_main(args.bases, args.workers, args.checkpoint_dir, args.resume)
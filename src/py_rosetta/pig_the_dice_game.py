@@ -22,8 +22,30 @@ Task
 
 Create a program to score for, and simulate dice throws for, a two-person game.
 '''
-from random import randrange
-from time import sleep
+import argparse
+import mmap
+import os
+import struct
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import combinations
+from math import sqrt
+from random import Random, randrange
+from time import perf_counter, sleep
+
+# Run as a script, this module has no package, so its neighbours are
+# imported as top-level modules from its directory.
+if __package__:
+    from .file_utils import cache_path, replace_file
+else:
+    from file_utils import cache_path, replace_file
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+GOAL = 100
 
 
 def display_opening_banner():
@@ -34,11 +56,113 @@ def display_opening_banner():
     print()
     sleep(2)
 
+# Block-buffered dice. Each call into the random module costs far more
+# than the roll itself, so BlockDice draws random bytes a block at a
+# time and turns them into faces with one bytes.translate: a byte is
+# mapped to its remainder by the number of sides, plus one, and the few
+# bytes at the top that would bias the result are deleted. Rolls are
+# then handed out by a bytes iterator. Dice for the coin that
+# `random_continue_round` tosses come from a buffer of their own. A
+# snapshot is the generator's state and what is left in the buffers,
+# so restoring one replays exactly the same rolls. `use_dice` makes
+# `pig_roll` and `random_continue_round` draw from a BlockDice; hot loops
+# can pass its `roll` method to the engine directly as `roll`.
+
+DICE_BLOCK = 1 << 16
+
+
+def die_table(sides):
+    '''Takes one arg: `sides` (int from 1 to 256).
+       Returns a 2-tuple of bytes for bytes.translate: the table mapping a
+       random byte to a face, and the bytes to delete.'''
+    usable = 256 - 256 % sides
+    return (bytes(byte % sides + 1 for byte in range(256)), bytes(range(usable, 256)))
+
+
+class BlockDice:
+    '''A seedable source of die rolls and continue-or-stop tosses, drawn from
+       random.Random in blocks of `block` bytes.'''
+
+    def __init__(self, seed=None, block=DICE_BLOCK):
+        assert block > 0, "BlockDice block must be positive."
+        self.rng = Random(seed)
+        self.block = block
+        self.roll_table = die_table(6)
+        self.toss_table = die_table(CONTINUE_THRESHOLD)
+        self.next_roll = iter(b'').__next__
+        self.next_toss = iter(b'').__next__
+
+    def draw(self, table):
+        '''Takes one arg: `table` (as returned by `die_table`).
+           Returns the __next__ method of a fresh, non-empty buffer of faces.
+           A small block can lose every byte to rejection, so blocks are drawn
+           until one yields a face.'''
+        while True:
+            faces = self.rng.randbytes(self.block).translate(*table)
+            if faces:
+                return iter(faces).__next__
+
+    def roll(self):
+        '''A drop-in for `pig_roll`. Returns an int from 1 to 6.'''
+        try:
+            return self.next_roll()
+        except StopIteration:
+            self.next_roll = self.draw(self.roll_table)
+            return self.next_roll()
+
+    def continue_round(self):
+        '''A drop-in for `random_continue_round`. Returns a Boolean.'''
+        try:
+            return self.next_toss() < CONTINUE_THRESHOLD
+        except StopIteration:
+            self.next_toss = self.draw(self.toss_table)
+            return self.next_toss() < CONTINUE_THRESHOLD
+
+    def snapshot(self):
+        '''Returns the state of the dice, for `restore`. Taking a snapshot
+           does not change what the dice will roll.'''
+        rolls = bytes(self.next_roll.__self__)
+        tosses = bytes(self.next_toss.__self__)
+        self.next_roll = iter(rolls).__next__
+        self.next_toss = iter(tosses).__next__
+        return self.rng.getstate(), rolls, tosses
+
+    def restore(self, snapshot):
+        '''Takes one arg: `snapshot` (as returned by `snapshot`).
+           Returns None.'''
+        state, rolls, tosses = snapshot
+        self.rng.setstate(state)
+        self.next_roll = iter(rolls).__next__
+        self.next_toss = iter(tosses).__next__
+
+
+dice = None
+
+
+def use_dice(source):
+    '''Makes `pig_roll` and `random_continue_round` draw from `source` (a
+       BlockDice), or from the random module again if `source` is None.
+       Returns None.'''
+    global dice
+    dice = source
+
+
 def pig_roll():
     '''Simulates a roll of a single 6-sided die.
-       Takes no args. Returns a random int from 1 to 6 inclusive'''
+       Takes no args. Returns a random int from 1 to 6 inclusive,
+       from the dice set by `use_dice` if there are any.'''
+    if dice is not None:
+        return dice.roll()
     return randrange(1, 7)
 
+
+def announced_roll():
+    '''Announces a roll, pauses, and rolls.
+       Takes no args. Returns the result of `pig_roll`.'''
+    print("Rolling...")
+    sleep(1)
+    return pig_roll()
+
     
 def query_opponent():
     '''Asks the player if he/she would rather play the computer or a human player.
@@ -56,11 +180,12 @@ def query_opponent():
                 print("\nPlease enter y or n\n")
 
 
-def human_round(player, score):
+def human_round(player, score, opponent_score=0):
     '''Runs a turn of the game in which the player is a human. 
     Takes two args:
         `player` (string)
-        `score` (number).
+        `score` (number)
+    and optionally `opponent_score` (number).
      Returns a number.
 
      Announces a new turn.
@@ -74,37 +199,38 @@ def human_round(player, score):
      wants to continue the turn. If so, the process is repeated. Otherwise,
      announces that the turn is finished and returns the additional points.
      The query is repeated until the user enters a sensical response.
+     The rules are those of `play_turn`; this function only adds the talking.
      '''
-    new_points = 0
     print(f"\n{player} turn.\n")
     input("Press ENTER to continue")
-    while True:
-        print("Rolling...")
-        sleep(1)
-        roll = pig_roll()
+
+    def announce(roll, new_points):
         if roll == 1:
             print(f"Player rolled 1. Turn finished. Score: {score}.")
             sleep(1)
-            return 0
-        new_points += roll
+            return
         print(f"Player rolled {roll}. {new_points} new points so far.")
-        if score + new_points >= 100:
+        if score + new_points >= GOAL:
             print(f"Turn finished. Score: {score + new_points}.")
             sleep(1)
-            return new_points
-        print(f"If the round stops now, {player} score will be {score + new_points}.")
+        else:
+            print(f"If the round stops now, {player} score will be {score + new_points}.")
+
+    def ask_player(score, opponent_score, new_points):
         while True:
             print("Roll again? (y/n)")
             response = input()[0]
             match response:
                 case 'y':
-                    break
+                    return True
                 case 'n':
                     print("Turn finished.")
-                    return new_points
+                    return False
                 case _:
                     print("Please enter y or n")
 
+    return play_turn(score, opponent_score, ask_player, announced_roll, announce)
+
 # To determine whether or not the computer will
 # continue its turn, a random integer between 1 and
 # CONTINUE_THRESHOLD (inclusive) is generated. If the result is
@@ -116,42 +242,795 @@ CONTINUE_THRESHOLD = 4
 
 def random_continue_round():
     '''Randomly determines whether or not the computer
-       should continue its turn. Takes no args. Returns a Boolean.'''
+       should continue its turn. Takes no args. Returns a Boolean.
+       Uses the dice set by `use_dice` if there are any.'''
+    if dice is not None:
+        return dice.continue_round()
     continue_score = randrange(1, CONTINUE_THRESHOLD+1)
     return continue_score < CONTINUE_THRESHOLD
+
+
+# The simulation engine. Nothing below prints, prompts or sleeps, so
+# games can be played in bulk; the interactive functions above and below
+# wrap it with the talking. A strategy is any callable taking
+# (score, opponent_score, turn_total) and returning True to roll again
+# or False to hold. It is only consulted while the player is short of
+# GOAL.
+
+def random_strategy(score, opponent_score, turn_total):
+    '''The computer's original strategy: roll again at random, as decided by
+       `random_continue_round`. Ignores its args. Returns a Boolean.'''
+    return random_continue_round()
+
+
+def hold_at(threshold):
+    '''Takes one arg: `threshold` (number).
+       Returns a strategy that rolls until the turn total reaches `threshold`.'''
+    def strategy(score, opponent_score, turn_total):
+        return turn_total < threshold
+    strategy.__name__ = f"hold_at_{threshold}"
+    return strategy
+
+
+def play_turn(score, opponent_score, strategy, roll=pig_roll, observer=None):
+    '''Plays one turn.
+    Takes three args:
+        `score` (number)
+        `opponent_score` (number)
+        `strategy` (strategy callable)
+    and optionally:
+        `roll` (callable taking no args and returning 1 to 6; `pig_roll` by default)
+        `observer` (callable taking (roll, turn_total), called after every roll).
+    Returns the points won this turn: 0 if a 1 was rolled, otherwise the
+    turn total when the player held or reached GOAL.'''
+    turn_total = 0
+    while True:
+        rolled = roll()
+        if rolled == 1:
+            if observer is not None:
+                observer(rolled, 0)
+            return 0
+        turn_total += rolled
+        if observer is not None:
+            observer(rolled, turn_total)
+        if score + turn_total >= GOAL:
+            return turn_total
+        if not strategy(score, opponent_score, turn_total):
+            return turn_total
+
+
+def play_game(first, second, roll=pig_roll, observer=None):
+    '''Plays a whole game between two strategies, `first` moving first.
+    Takes two args: `first` and `second` (strategy callables), and
+    optionally `roll` and `observer` (as for `play_turn`).
+    Returns a 3-tuple: the index of the winner (0 or 1), the final scores as
+    a list, and the number of turns played.'''
+    strategies = (first, second)
+    scores = [0, 0]
+    player = 0
+    turns = 0
+    while True:
+        turns += 1
+        scores[player] += play_turn(scores[player], scores[1 - player], strategies[player],
+                                    roll, observer)
+        if scores[player] >= GOAL:
+            return player, scores, turns
+        player = 1 - player
+
+
+def simulate_games(first, second, games, roll=pig_roll, recorder=None):
+    '''Plays `games` games between `first` and `second`, alternating which of
+    them moves first.
+    Takes three args: `first` and `second` (strategy callables) and `games`
+    (int), and optionally `roll` (as for `play_turn`) and `recorder` (a
+    GameRecorder to log every roll and decision to).
+    Returns a list of two ints: the games won by `first` and by `second`.'''
+    observer = None
+    if recorder is not None:
+        first, second = recorder.watch(first), recorder.watch(second)
+        observer = recorder.observe
+    wins = [0, 0]
+    for game in range(games):
+        if recorder is not None:
+            recorder.start_game(game % 2)
+        if game % 2:
+            winner = 1 - play_game(second, first, roll, observer)[0]
+        else:
+            winner = play_game(first, second, roll, observer)[0]
+        wins[winner] += 1
+    return wins
+
+
+# The batch simulator plays many games at once with NumPy arrays: each
+# step rolls once for every unfinished game, and the rules of
+# `play_turn` become masks over those arrays. Batch strategies take
+# arrays (score, opponent_score, turn_total) for the games awaiting a
+# decision, plus the NumPy Generator, and return a boolean array, True
+# to roll again. NumPy is only needed for this part of the module.
+
+BATCH_BLOCK = 64
+
+
+def batch_random_strategy(score, opponent_score, turn_total, rng):
+    '''The batch form of `random_strategy`.'''
+    return rng.integers(1, CONTINUE_THRESHOLD + 1, size=turn_total.shape) < CONTINUE_THRESHOLD
+
+
+def batch_hold_at(threshold):
+    '''The batch form of `hold_at`.'''
+    def strategy(score, opponent_score, turn_total, rng):
+        return turn_total < threshold
+    strategy.__name__ = f"batch_hold_at_{threshold}"
+    return strategy
+
+
+def simulate_batch(first, second, games, seed=None, block=BATCH_BLOCK):
+    '''Plays `games` games between two batch strategies, all at once,
+    alternating which of them moves first as `simulate_games` does.
+    Takes three args: `first` and `second` (batch strategies) and `games`
+    (int), and optionally `seed` (for numpy.random.default_rng) and `block`
+    (how many rolls per game to draw from the generator at a time).
+    Returns a dict:
+        'wins': games won by `first` and by `second` (list of two ints)
+        'win_rate': the fraction won by `first` (float)
+        'turns': a count of games by length in turns (numpy array; item t
+                 is the number of games that took t turns)
+        'mean_turns': the mean game length in turns (float).
+    The rate and mean are 0.0 if no games were played.'''
+    if np is None:
+        raise ImportError("simulate_batch needs NumPy")
+    rng = np.random.default_rng(seed)
+    strategies = (first, second)
+    scores = np.zeros((games, 2), dtype=np.int64)
+    turn_total = np.zeros(games, dtype=np.int64)
+    turns = np.zeros(games, dtype=np.int64)
+    winner = np.zeros(games, dtype=np.int64)
+    player = np.arange(games) % 2
+    live = np.arange(games)
+    row = block
+    while live.size:
+        if row == block:
+            rolls = rng.integers(1, 7, size=(block, live.size), dtype=np.int64)
+            row = 0
+        rolled = rolls[row, :live.size]
+        row += 1
+        mover = player[live]
+        score = scores[live, mover]
+        opponent_score = scores[live, 1 - mover]
+        bust = rolled == 1
+        total = np.where(bust, 0, turn_total[live] + rolled)
+        reached = ~bust & (score + total >= GOAL)
+        undecided = ~bust & ~reached
+        keep_going = np.zeros(live.size, dtype=bool)
+        for (index, strategy) in enumerate(strategies):
+            deciding = undecided & (mover == index)
+            if deciding.any():
+                keep_going[deciding] = strategy(score[deciding], opponent_score[deciding],
+                                                 total[deciding], rng)
+        hold = undecided & ~keep_going
+        banked = reached | hold
+        scores[live[banked], mover[banked]] += total[banked]
+        finished_turn = bust | banked
+        turns[live[finished_turn]] += 1
+        total[finished_turn] = 0
+        turn_total[live] = total
+        passed = bust | hold
+        player[live[passed]] = 1 - mover[passed]
+        winner[live[reached]] = mover[reached]
+        live = live[~reached]
+    wins = np.bincount(winner, minlength=2)
+    return {
+        'wins': wins.tolist(),
+        'win_rate': wins[0] / games if games else 0.0,
+        'turns': np.bincount(turns),
+        'mean_turns': turns.mean() if games else 0.0,
+    }
                     
 
-def computer_round(score):
+# The optimal policy, after Neller and Presser. P(i, j, k) is the chance
+# of winning for a player with score i, whose opponent has j, holding a
+# turn total of k before deciding. Rolling is worth
+#     (1 - P(j, i, 0) + P(i, j, k+2) + ... + P(i, j, k+6)) / 6
+# and holding 1 - P(j, i+k, 0), counting any state at or past GOAL as a
+# win. Holding only ever leads to a higher score sum i+j, so the sums are
+# solved from the top down; within one sum the turn-start values P(i, j, 0)
+# and P(j, i, 0) depend on each other, and are found by value iteration.
+# The policy keeps one bit per (i, j, k), set if rolling is better:
+# 125,000 bytes for GOAL 100, behind a small header. It is saved once and
+# memory-mapped after that; a game against the computer makes sure it is
+# ready before the first turn.
+
+POLICY_HEADER = struct.Struct('<4sI')
+POLICY_MAGIC = b'PIG1'
+POLICY_FILE = 'pig_policy.bin'
+# Where the policy is looked for, and saved to if it has to be solved:
+# the user's cache directory, or failing that beside this module.
+POLICY_PATHS = (cache_path(POLICY_FILE),
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), POLICY_FILE))
+SOLVER_TOLERANCE = 1e-12
+
+
+def policy_index(score, opponent_score, turn_total, goal=GOAL):
+    '''Takes three args: `score`, `opponent_score` and `turn_total` (ints,
+       the first and last summing to less than `goal`), and optionally `goal`
+       (int). Returns the bit index of that state in a policy table (int).'''
+    return (score * goal + opponent_score) * goal + turn_total
+
+
+def solve_policy(goal=GOAL, tolerance=SOLVER_TOLERANCE):
+    '''Finds the policy that maximizes the chance of winning.
+       Takes no args, and optionally `goal` (int) and `tolerance` (float, the
+       largest change in a win probability at which iteration stops).
+       Returns a 2-tuple: the policy (bytearray, one bit per state as laid out
+       by `policy_index`) and the turn-start win probabilities (list of lists;
+       item [i][j] is P(i, j, 0)).'''
+    win = [[0.0] * goal for _ in range(goal)]
+    policy = bytearray((goal ** 3 + 7) // 8)
+
+    def solve_turn(score, opponent_score, record):
+        # Fills in P(score, opponent_score, k) from the highest turn total
+        # down, taking P(opponent_score, score, 0) as it currently stands.
+        # Slots at or past goal - score stay 1.0, as those are wins.
+        pass_value = 1.0 - win[opponent_score][score]
+        opponent_win = win[opponent_score]
+        values = [1.0] * (goal - score + 6)
+        for k in range(goal - 1 - score, -1, -1):
+            roll = (pass_value + values[k + 2] + values[k + 3] + values[k + 4]
+                    + values[k + 5] + values[k + 6]) / 6
+            hold = 1.0 - opponent_win[score + k] if k else pass_value
+            if roll > hold:
+                values[k] = roll
+                if record:
+                    index = policy_index(score, opponent_score, k, goal)
+                    policy[index >> 3] |= 1 << (index & 7)
+            else:
+                values[k] = hold
+        return values[0]
+
+    for score_sum in range(2 * goal - 2, -1, -1):
+        states = [(score, score_sum - score)
+                  for score in range(max(0, score_sum - goal + 1), min(goal - 1, score_sum) + 1)]
+        while True:
+            change = 0.0
+            for (score, opponent_score) in states:
+                value = solve_turn(score, opponent_score, False)
+                change = max(change, abs(value - win[score][opponent_score]))
+                win[score][opponent_score] = value
+            if change < tolerance:
+                break
+        for (score, opponent_score) in states:
+            solve_turn(score, opponent_score, True)
+    return policy, win
+
+
+def save_policy(path, policy, goal=GOAL):
+    '''Takes two args: `path` (str) and `policy` (bytes-like, as returned by
+       `solve_policy`), and optionally `goal` (int). Returns None.'''
+    replace_file(path, POLICY_HEADER.pack(POLICY_MAGIC, goal) + bytes(policy))
+
+
+def load_policy(path):
+    '''Takes one arg: `path` (str) of a file written by `save_policy`.
+       Returns a 2-tuple: the goal (int) and the policy, as a read-only
+       memoryview over a memory map of the file.'''
+    with open(path, 'rb') as source:
+        buffer = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, goal = POLICY_HEADER.unpack_from(buffer)
+    if magic != POLICY_MAGIC:
+        buffer.close()
+        raise ValueError(f"{path} is not a Pig policy table")
+    return goal, memoryview(buffer)[POLICY_HEADER.size:]
+
+
+def policy_strategy(policy, goal=GOAL):
+    '''Takes one arg: `policy` (bytes-like, laid out by `policy_index`), and
+       optionally `goal` (int, which the policy was solved for).
+       Returns a strategy that looks each decision up in `policy`.'''
+    def strategy(score, opponent_score, turn_total):
+        index = (score * goal + opponent_score) * goal + turn_total
+        return bool(policy[index >> 3] >> (index & 7) & 1)
+    return strategy
+
+
+_optimal_strategy = None
+
+
+def load_optimal_policy(announce=None):
+    '''Makes the optimal policy ready, loading it from the first of
+       POLICY_PATHS that holds one, or else solving it (a few seconds) and
+       saving it to the first that can be written.
+       Takes no args, and optionally `announce` (callable given a message
+       before solving). Returns the strategy built by `policy_strategy`.'''
+    global _optimal_strategy
+    if _optimal_strategy is not None:
+        return _optimal_strategy
+    for path in POLICY_PATHS:
+        try:
+            goal, policy = load_policy(path)
+        except (OSError, ValueError, struct.error):
+            continue
+        if goal == GOAL:
+            break
+    else:
+        if announce is not None:
+            announce("Working out how to play. This takes a few seconds, once.")
+        policy = solve_policy(GOAL)[0]
+        for path in POLICY_PATHS:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                save_policy(path, policy)
+                break
+            except OSError:
+                continue
+    _optimal_strategy = policy_strategy(policy)
+    return _optimal_strategy
+
+
+def optimal_strategy(score, opponent_score, turn_total):
+    '''Plays to maximize the chance of winning, by a table lookup. Calls
+       `load_optimal_policy` first if no one has yet. Returns a Boolean.'''
+    return (_optimal_strategy or load_optimal_policy())(score, opponent_score, turn_total)
+
+
+computer_strategy = optimal_strategy
+
+
+# The tournament. Every pair of registered strategies plays a match, in
+# batches of games run on a process pool. Strategies are sent to the
+# workers by name, so a strategy must be registered when this module is
+# imported to be usable there. Each batch plays with BlockDice seeded
+# from its match's own generator, which is in turn seeded from the
+# tournament's, so every batch has its own stream.
+# A seeded tournament deals each match the same batches on any number of
+# workers, though where a match stops can vary with their timing.
+# A match stops once the 95% Wilson interval on its win rate is no wider
+# than +/- `precision`, or after `max_games`.
+
+STRATEGIES = {
+    'random': random_strategy,
+    'optimal': optimal_strategy,
+}
+STRATEGIES.update((f"hold_at_{n}", hold_at(n)) for n in (15, 20, 25, 30))
+
+TOURNAMENT_BATCH = 500
+TOURNAMENT_PRECISION = 0.01
+TOURNAMENT_MAX_GAMES = 100_000
+Z_95 = 1.959964
+
+
+def register_strategy(name, strategy):
+    '''Adds `strategy` (strategy callable) to the tournament under `name`
+       (str). Returns None.'''
+    STRATEGIES[name] = strategy
+
+
+def wilson_interval(wins, games, z=Z_95):
+    '''Takes two args: `wins` and `games` (ints), and optionally `z` (float).
+       Returns the Wilson score interval for the win rate as a 2-tuple of
+       floats; (0.0, 1.0) if no games were played.'''
+    if not games:
+        return 0.0, 1.0
+    rate = wins / games
+    scale = 1 + z * z / games
+    centre = (rate + z * z / (2 * games)) / scale
+    half = z * sqrt(rate * (1 - rate) / games + z * z / (4 * games * games)) / scale
+    return centre - half, centre + half
+
+
+def play_batch(first, second, games, batch_seed):
+    '''Plays a batch of a tournament match in a worker.
+       Takes four args: `first` and `second` (registered strategy names),
+       `games` (int) and `batch_seed` (int).
+       Returns the games won by `first` (int).'''
+    batch_dice = BlockDice(batch_seed)
+    use_dice(batch_dice)
+    return simulate_games(STRATEGIES[first], STRATEGIES[second], games, batch_dice.roll)[0]
+
+
+class Match:
+    '''The state of one pairing in a tournament: the strategy names, the
+       games played and won by the first, the games sent out in batches and
+       not yet back, and the generator its batch seeds come from.'''
+
+    def __init__(self, first, second, match_seed):
+        self.first = first
+        self.second = second
+        self.games = 0
+        self.wins = 0
+        self.outstanding = 0
+        self.rng = Random(match_seed)
+
+    def interval(self):
+        '''Returns the Wilson interval for the first's win rate.'''
+        return wilson_interval(self.wins, self.games)
+
+    def settled(self, precision, max_games):
+        '''Returns True if no more batches should be sent.'''
+        if self.games + self.outstanding >= max_games:
+            return True
+        if not self.games:
+            return False
+        low, high = self.interval()
+        return (high - low) / 2 <= precision
+
+    def next_batch(self, max_games):
+        '''Returns the size of the next batch (int): TOURNAMENT_BATCH, or
+           fewer if that would take the match past `max_games`.'''
+        return min(TOURNAMENT_BATCH, max_games - self.games - self.outstanding)
+
+
+def run_tournament(names=None, workers=None, precision=TOURNAMENT_PRECISION,
+                   max_games=TOURNAMENT_MAX_GAMES, tournament_seed=None):
+    '''Plays a round robin between registered strategies.
+       Takes no args, and optionally `names` (registered strategy names; all
+       of them by default), `workers` (number of processes; all CPUs by
+       default), `precision` (float, the half-width of the interval at which
+       a match stops), `max_games` (int, per match) and `tournament_seed`.
+       Returns a 2-tuple: the matches (list of Match) and the ranking, a list
+       of (name, mean win rate over its matches, half-width of its 95%
+       interval) tuples, best first.'''
+    names = list(STRATEGIES) if names is None else list(dict.fromkeys(names))
+    if len(names) < 2:
+        raise ValueError("a tournament needs at least two strategies")
+    if max_games <= 0:
+        raise ValueError("max_games must be positive")
+    if 'optimal' in names:
+        # Solve or load the policy once, here, not in every worker.
+        load_optimal_policy()
+    master = Random(tournament_seed)
+    matches = [Match(first, second, master.getrandbits(64))
+               for (first, second) in combinations(names, 2)]
+    # Two batches per worker keep them busy while results come back.
+    in_flight = 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(workers) as pool:
+        pending = {}
+
+        def fill():
+            # Hands out batches round robin over the unsettled matches.
+            while len(pending) < in_flight:
+                open_matches = [match for match in matches
+                                if not match.settled(precision, max_games)]
+                if not open_matches:
+                    return
+                for match in open_matches:
+                    if len(pending) >= in_flight:
+                        return
+                    games = match.next_batch(max_games)
+                    future = pool.submit(play_batch, match.first, match.second,
+                                         games, match.rng.getrandbits(64))
+                    match.outstanding += games
+                    pending[future] = (match, games)
+
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                (match, games) = pending.pop(future)
+                match.outstanding -= games
+                match.games += games
+                match.wins += future.result()
+            fill()
+    return matches, rank_strategies(names, matches)
+
+
+def rank_strategies(names, matches, z=Z_95):
+    '''Takes two args: `names` (strategy names) and `matches` (played Match
+       objects), and optionally `z` (float).
+       Returns the ranking described in `run_tournament`. A strategy's rate is
+       the mean of its win rates against each opponent, so every opponent
+       counts the same however many games its match took. Matches with no
+       games are left out; a strategy with none at all gets a rate of 0.'''
+    rates = {name: [] for name in names}
+    for match in matches:
+        if not match.games:
+            continue
+        rate = match.wins / match.games
+        variance = rate * (1 - rate) / match.games
+        rates[match.first].append((rate, variance))
+        rates[match.second].append((1 - rate, variance))
+    ranking = []
+    for (name, results) in rates.items():
+        count = len(results)
+        if not count:
+            ranking.append((name, 0.0, 0.0))
+            continue
+        mean = sum(rate for (rate, _) in results) / count
+        half = z * sqrt(sum(variance for (_, variance) in results)) / count
+        ranking.append((name, mean, half))
+    ranking.sort(key=lambda entry: entry[1], reverse=True)
+    return ranking
+
+
+def tournament_main(names=None, workers=None, precision=TOURNAMENT_PRECISION,
+                    max_games=TOURNAMENT_MAX_GAMES, tournament_seed=None):
+    '''Runs `run_tournament` with the same args and prints each match and the
+       ranking with its error bars. Returns None.'''
+    start = perf_counter()
+    matches, ranking = run_tournament(names, workers, precision, max_games, tournament_seed)
+    for match in matches:
+        low, high = match.interval()
+        rate = match.wins / match.games if match.games else 0.0
+        print(f"{match.first:>12} v {match.second:<12} {rate:6.3f}"
+              f" [{low:.3f}, {high:.3f}] {match.games:>7} games")
+    print()
+    for (place, (name, rate, half)) in enumerate(ranking, 1):
+        print(f"{place:>3}. {name:<12} {rate:6.3f} +/- {half:.3f}")
+    print(f"Total: {perf_counter() - start:.2f}s")
+
+
+# The game log. Every roll is one byte: the face in the low three bits,
+# and above them what the player decided after it: NO_DECISION when the
+# rules ended the turn (a 1, or reaching GOAL), else LOG_HOLD or LOG_ROLL.
+# A byte with a zero face starts a game, bit 3 giving which player moved
+# first. Turns and scores are not stored; they follow from the rolls and
+# decisions, and `replay_game` rebuilds them. The file opens with a
+# header: magic, version, goal, and the two players' names, each a
+# varint length and UTF-8. A game between good players is about 75 rolls,
+# so about 75 bytes.
+
+LOG_HEADER = struct.Struct('<4sBH')
+LOG_MAGIC = b'PIGL'
+LOG_VERSION = 1
+NO_DECISION = 0
+LOG_HOLD = 1
+LOG_ROLL = 2
+LOG_BUFFER = 1 << 16
+
+
+def encode_varint(value):
+    '''Takes one arg: `value` (non-negative int).
+       Returns it as a LEB128 varint (bytes).'''
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append(value & 0x7F | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def decode_varint(buffer, offset):
+    '''Takes two args: `buffer` (bytes-like) and `offset` (int).
+       Returns a 2-tuple: the varint at `offset` (int) and the offset after it.'''
+    value = shift = 0
+    while True:
+        byte = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+class GameRecorder:
+    '''Writes a game log to a binary stream. Pass one to `simulate_games`, or
+       call `start_game` before each game and play it with `observe` as the
+       observer and strategies wrapped by `watch`. A roll is held back until
+       its decision is known; if none comes, the rules ended the turn.'''
+
+    def __init__(self, stream, names, goal=GOAL):
+        self.stream = stream
+        self.pending = None
+        self.games = 0
+        self.buffer = bytearray(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, goal))
+        for name in names:
+            encoded = name.encode()
+            self.buffer += encode_varint(len(encoded)) + encoded
+
+    def emit(self, record):
+        '''Flushes any held-back roll, then appends `record` (int) unless it
+           is None. Returns None.'''
+        if self.pending is not None:
+            self.buffer.append(self.pending)
+            self.pending = None
+        if record is not None:
+            self.buffer.append(record)
+        if len(self.buffer) >= LOG_BUFFER:
+            self.stream.write(self.buffer)
+            self.buffer.clear()
+
+    def start_game(self, first_player):
+        '''Marks the start of a game that player `first_player` (0 or 1)
+           moves first in. Returns None.'''
+        self.games += 1
+        self.emit(first_player << 3)
+
+    def observe(self, rolled, turn_total):
+        '''An observer for `play_turn`. Returns None.'''
+        self.emit(None)
+        if rolled == 1:
+            self.emit(1)
+        else:
+            self.pending = rolled
+
+    def watch(self, strategy):
+        '''Takes one arg: `strategy` (strategy callable).
+           Returns the same strategy, logging each decision it makes.'''
+        def watched(score, opponent_score, turn_total):
+            keep_going = strategy(score, opponent_score, turn_total)
+            self.pending |= (LOG_ROLL if keep_going else LOG_HOLD) << 3
+            return keep_going
+        watched.__name__ = getattr(strategy, '__name__', 'strategy')
+        return watched
+
+    def close(self):
+        '''Writes out what is buffered. Does not close the stream.'''
+        self.emit(None)
+        self.stream.write(self.buffer)
+        self.buffer.clear()
+
+
+def open_game_log(path):
+    '''Takes one arg: `path` (str) of a game log.
+       Returns a 3-tuple: a read-only memory map of the file, the offset of
+       its first record (int) and the header as a dict with 'goal' and
+       'names'.'''
+    with open(path, 'rb') as source:
+        buffer = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, goal = LOG_HEADER.unpack_from(buffer)
+    if magic != LOG_MAGIC or version != LOG_VERSION:
+        buffer.close()
+        raise ValueError(f"{path} is not a Pig game log")
+    offset = LOG_HEADER.size
+    names = []
+    for _ in range(2):
+        length, offset = decode_varint(buffer, offset)
+        names.append(bytes(buffer[offset:offset + length]).decode())
+        offset += length
+    return buffer, offset, {'goal': goal, 'names': names}
+
+
+def read_game_log_header(path):
+    '''Takes one arg: `path` (str) of a game log.
+       Returns its header, as `open_game_log` does.'''
+    buffer, _, header = open_game_log(path)
+    buffer.close()
+    return header
+
+
+def read_game_log(path):
+    '''Generator.
+       Takes one arg: `path` (str) of a game log.
+       Yields each game as a 2-tuple: the player who moved first (0 or 1) and
+       its rolls, a bytes object of log records. Reads through a memory map,
+       so only the game being yielded is ever copied into memory.'''
+    buffer, offset, _ = open_game_log(path)
+    with buffer:
+        end = len(buffer)
+        while offset < end:
+            marker = buffer[offset]
+            start = offset = offset + 1
+            while offset < end and buffer[offset] & 7:
+                offset += 1
+            yield marker >> 3, buffer[start:offset]
+
+
+def replay_game(first_player, records):
+    '''Rebuilds a game from its log records.
+       Takes two args: `first_player` (0 or 1) and `records` (bytes), as
+       yielded by `read_game_log`.
+       Returns a 3-tuple: the winner (0 or 1), the final scores as a list, and
+       the turns as a list of (player, rolls, points won) tuples.'''
+    scores = [0, 0]
+    turns = []
+    player = first_player
+    rolls = []
+    turn_total = 0
+    for record in records:
+        rolled = record & 7
+        rolls.append(rolled)
+        if rolled == 1:
+            turn_total = 0
+        else:
+            turn_total += rolled
+        if record >> 3 == LOG_ROLL:
+            continue
+        scores[player] += turn_total
+        turns.append((player, rolls, turn_total))
+        rolls = []
+        turn_total = 0
+        player = 1 - player
+    return turns[-1][0], scores, turns
+
+
+def game_log_stats(paths):
+    '''Takes one arg: `paths` (iterable of game log paths).
+       Returns a dict of totals over every game in them: 'games', 'wins' (by
+       player, as named in each log), 'first_player_wins', 'turns', 'rolls',
+       'faces' (count of each face, 1 to 6), 'holds', 'busts',
+       'mean_turns' and 'mean_points_per_turn'.'''
+    games = turns = holds = busts = first_player_wins = points = 0
+    wins = {}
+    faces = [0] * 7
+    for path in paths:
+        names = read_game_log_header(path)['names']
+        for (first_player, records) in read_game_log(path):
+            winner, scores, played = replay_game(first_player, records)
+            games += 1
+            wins[names[winner]] = wins.get(names[winner], 0) + 1
+            first_player_wins += winner == first_player
+            turns += len(played)
+            points += sum(scores)
+            for record in records:
+                faces[record & 7] += 1
+                holds += record >> 3 == LOG_HOLD
+            busts += sum(rolls[-1] == 1 for (_, rolls, _) in played)
+    return {
+        'games': games,
+        'wins': wins,
+        'first_player_wins': first_player_wins,
+        'turns': turns,
+        'rolls': sum(faces),
+        'faces': faces[1:],
+        'holds': holds,
+        'busts': busts,
+        'mean_turns': turns / games if games else 0.0,
+        'mean_points_per_turn': points / turns if turns else 0.0,
+    }
+
+
+def record_games(path, first, second, games):
+    '''Plays `games` games between two registered strategies, named `first`
+       and `second`, logging them to `path` (str).
+       Returns the wins, as `simulate_games` does.'''
+    with open(path, 'wb') as out:
+        recorder = GameRecorder(out, (first, second))
+        wins = simulate_games(STRATEGIES[first], STRATEGIES[second], games, recorder=recorder)
+        recorder.close()
+    return wins
+
+
+def replay_main(path, game_number=0):
+    '''Prints game `game_number` of the log at `path` turn by turn.
+       Returns None.'''
+    names = read_game_log_header(path)['names']
+    games = 0
+    for (first_player, records) in read_game_log(path):
+        if games == game_number:
+            break
+        games += 1
+    else:
+        print(f"{path} has only {games} games")
+        return
+    winner, scores, turns = replay_game(first_player, records)
+    running = [0, 0]
+    for (player, rolls, won) in turns:
+        running[player] += won
+        print(f"{names[player]:>12}: rolled {' '.join(map(str, rolls)):<30}"
+              f" +{won:<3} {running[0]:>3} - {running[1]:<3}")
+    print(f"\n{names[winner]} won, {scores[winner]} to {scores[1 - winner]}")
+
+
+def computer_round(score, opponent_score=0):
     '''Simulates a turn of the game in which the player is the computer.
-       Takes one arg: `score` (number).
+       Takes one arg: `score` (number), and optionally `opponent_score` (number).
        Returns a number.
        Operation is similar to that of `human_round`, except
-       the decision to continue the turn is made randomly.'''
-    new_points = 0
+       the decision to continue the turn is made by `computer_strategy`.'''
     print("My turn.\n")
-    while True:
-        print("Rolling...")
-        sleep(1)
-        roll = pig_roll()
+
+    def announce(roll, new_points):
         if roll == 1:
             print(f"I rolled 1. Turn finished. Score: {score}.")
             sleep(1)
-            return 0
-        new_points += roll
+            return
         print(f"I rolled {roll}. {new_points} new points so far.")
-        if score + new_points >= 100:
+        if score + new_points >= GOAL:
             print(f"Turn finished. Score: {score + new_points}")
             sleep(1)
-            return new_points
-        print(f"If the round stops now, my score will be {score + new_points}.")
-        will_keep_going = random_continue_round()
+        else:
+            print(f"If the round stops now, my score will be {score + new_points}.")
+
+    def announced_strategy(score, opponent_score, new_points):
+        will_keep_going = computer_strategy(score, opponent_score, new_points)
         if will_keep_going:
             print("I will roll again")
         else:
             print("I will stop here.")
             print("Turn finished")
             sleep(1)
-            return new_points
+        return will_keep_going
+
+    return play_turn(score, opponent_score, announced_strategy, announced_roll, announce)
                     
 
 def play_computer_game():
@@ -161,14 +1040,16 @@ def play_computer_game():
        `computer_round` until one of the scores >= 100. At that time,
        returns a tuple of three values: winner (string), winner_score
        (number) and loser_score (number)'''
+    if computer_strategy is optimal_strategy:
+        load_optimal_policy(print)
     human_score = 0
     computer_score = 0
     while True:
-        human_score += human_round("Your", human_score)
-        if human_score >= 100:
+        human_score += human_round("Your", human_score, computer_score)
+        if human_score >= GOAL:
             return "You", human_score, computer_score
-        computer_score += computer_round(computer_score)
-        if computer_score >= 100:
+        computer_score += computer_round(computer_score, human_score)
+        if computer_score >= GOAL:
             return "I", computer_score, human_score
 
 
@@ -181,11 +1062,11 @@ def play_human_game():
     player_1_score = 0
     player_2_score = 0
     while True:
-        player_1_score += human_round("Player 1's", player_1_score)
-        if player_1_score >= 100:
+        player_1_score += human_round("Player 1's", player_1_score, player_2_score)
+        if player_1_score >= GOAL:
             return "Player 1", player_1_score, player_2_score
-        player_2_score += human_round("Player 2's", player_2_score)
-        if player_2_score >= 100:
+        player_2_score += human_round("Player 2's", player_2_score, player_1_score)
+        if player_2_score >= GOAL:
             return "Player 2", player_2_score, player_1_score
 
 
@@ -258,5 +1139,48 @@ def pig_main():
     display_closing_banner()
     
 
+def parse_args(argv=None):
+    '''Parses the command line (or `argv`, if given).
+       Returns an argparse.Namespace.'''
+    parser = argparse.ArgumentParser(
+        description="Play Pig, run a strategy tournament, or record and analyse game logs.")
+    parser.add_argument('--tournament', action='store_true',
+                        help="play the registered strategies against each other")
+    parser.add_argument('--strategies', nargs='+', choices=sorted(STRATEGIES), default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--precision', type=float, default=TOURNAMENT_PRECISION,
+                        help="stop a match once its 95%% interval is this wide either side")
+    parser.add_argument('--max-games', type=int, default=TOURNAMENT_MAX_GAMES)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--record', metavar='LOG', default=None,
+                        help="play the first two --strategies and log every game to LOG")
+    parser.add_argument('--games', type=int, default=10_000, help="games to --record")
+    parser.add_argument('--replay', metavar='LOG', default=None,
+                        help="print a game from LOG turn by turn")
+    parser.add_argument('--game', type=int, default=0, help="which game to --replay")
+    parser.add_argument('--log-stats', metavar='LOG', nargs='+', default=None,
+                        help="print totals over every game in the LOGs")
+    args = parser.parse_args(argv)
+    if args.record is not None and (args.strategies is None or len(args.strategies) < 2):
+        parser.error("--record needs two --strategies")
+    if args.tournament and args.strategies is not None and len(set(args.strategies)) < 2:
+        parser.error("--tournament needs at least two different --strategies")
+    if args.max_games <= 0:
+        parser.error("--max-games must be positive")
+    return args
+
+
 if __name__ == "__main__":
-    pig_main()
+    args = parse_args()
+    if args.tournament:
+        tournament_main(args.strategies, args.workers, args.precision, args.max_games, args.seed)
+    elif args.record is not None:
+        use_dice(BlockDice(args.seed))
+        print(record_games(args.record, args.strategies[0], args.strategies[1], args.games))
+    elif args.replay is not None:
+        replay_main(args.replay, args.game)
+    elif args.log_stats is not None:
+        for (name, value) in game_log_stats(args.log_stats).items():
+            print(f"{name:>20}: {value}")
+    else:
+        pig_main()
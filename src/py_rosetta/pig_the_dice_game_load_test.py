@@ -0,0 +1,179 @@
+# pig_the_dice_game_load_test.py: Load test for the Pig game server
+
+'''Opens many client sessions against a Pig server at once, each playing
+games with a strategy, and reports throughput and how long the server took
+to answer each decision. With no address it starts a server in-process on
+a Unix socket, with no pause between the computer's rolls.
+
+    python -m py_rosetta.pig_the_dice_game_load_test --clients 2000 --games 5
+    python -m py_rosetta.pig_the_dice_game_load_test --port 8642 --clients 500
+'''
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import tempfile
+from time import perf_counter
+
+# Run as a script, this module has no package, so its neighbours are
+# imported as top-level modules from its directory.
+if __package__:
+    from .pig_the_dice_game import STRATEGIES
+    from .pig_the_dice_game_server import (DEFAULT_HOST, PigServer, open_pig_connection,
+                                           play_remote)
+else:
+    from pig_the_dice_game import STRATEGIES
+    from pig_the_dice_game_server import (DEFAULT_HOST, PigServer, open_pig_connection,
+                                          play_remote)
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+DEFAULT_CLIENTS = 1000
+DEFAULT_GAMES = 3
+# Connections are opened this many at a time, as a burst of thousands
+# can overflow the server's listen backlog. Sessions stay open once made.
+CONNECTS_IN_FLIGHT = 200
+
+
+def raise_file_limit():
+    '''Raises the soft limit on open files to the hard limit, where the
+       platform allows it, since every session holds a socket (two, with the
+       server in-process). Returns the limit in force (int), or None.'''
+    if resource is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            soft = hard
+        except (ValueError, OSError):
+            pass
+    return soft
+
+
+async def run_client(address, strategy, games, bot, latencies, connecting):
+    '''Plays `games` games over one connection, opened while holding the
+       `connecting` semaphore, timing each round trip from a decision being
+       sent to the server's next line. Returns the games won.'''
+    async with connecting:
+        reader, writer = await open_pig_connection(*address)
+        await reader.readline()
+    sent = None
+
+    async def decide(score, opponent_score, turn_total):
+        nonlocal sent
+        sent = perf_counter()
+        return strategy(score, opponent_score, turn_total)
+
+    def on_line(words):
+        nonlocal sent
+        if sent is not None:
+            latencies.append(perf_counter() - sent)
+            sent = None
+
+    wins = 0
+    try:
+        for _ in range(games):
+            wins += 1 - await play_remote(reader, writer, decide, bot, on_line)
+        writer.write(b'QUIT\n')
+        await writer.drain()
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    return wins
+
+
+def percentile(ordered, fraction):
+    '''Takes two args: `ordered` (sorted list of numbers) and `fraction`
+       (float from 0 to 1). Returns the nearest-rank percentile.'''
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def load_test(clients, games, strategy, bot, address=None):
+    '''Runs `clients` sessions at once against the server at `address` (a
+       (host, port, path) tuple), or an in-process one if None.
+       Returns a dict of results.'''
+    server = listener = directory = None
+    if address is None:
+        directory = tempfile.TemporaryDirectory()
+        address = (None, None, os.path.join(directory.name, 'pig.sock'))
+        server = PigServer(bot_delay=0)
+        listener = await server.start(path=address[2])
+    latencies = []
+    connecting = asyncio.Semaphore(CONNECTS_IN_FLIGHT)
+    start = perf_counter()
+    try:
+        outcomes = await asyncio.gather(
+            *(run_client(address, STRATEGIES[strategy], games, bot, latencies, connecting)
+              for _ in range(clients)),
+            return_exceptions=True)
+    finally:
+        elapsed = perf_counter() - start
+        if listener is not None:
+            # Let the sessions see their clients go before shutting down.
+            while server.active:
+                await asyncio.sleep(0.01)
+            listener.close()
+            await listener.wait_closed()
+            directory.cleanup()
+    failures = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+    played = (clients - len(failures)) * games
+    latencies.sort()
+    return {
+        'clients': clients,
+        'games_per_client': games,
+        'failed_clients': len(failures),
+        'first_failure': repr(failures[0]) if failures else None,
+        'games': played,
+        'client_wins': sum(outcome for outcome in outcomes if isinstance(outcome, int)),
+        'seconds': elapsed,
+        'games_per_second': played / elapsed,
+        'decisions': len(latencies),
+        'latency_ms': {
+            'p50': percentile(latencies, 0.5) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'max': latencies[-1] * 1000,
+        } if latencies else None,
+    }
+
+
+def parse_args(argv=None):
+    '''Parses the command line (or `argv`, if given). Returns an argparse.Namespace.'''
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=DEFAULT_CLIENTS)
+    parser.add_argument('--games', type=int, default=DEFAULT_GAMES, help="games per client")
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default='hold_at_20',
+                        help="how the clients play")
+    parser.add_argument('--bot', choices=sorted(STRATEGIES), default=None,
+                        help="the server's strategy")
+    parser.add_argument('--host', default=None,
+                        help="server to test (default: start one in-process)")
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--unix', default=None, help="Unix socket of the server to test")
+    return parser.parse_args(argv)
+
+
+def load_test_main(argv=None):
+    '''Runs the load test described on the command line and prints a JSON report.'''
+    args = parse_args(argv)
+    address = None
+    if args.unix is not None or args.port is not None:
+        address = (args.host or DEFAULT_HOST, args.port, args.unix)
+    file_limit = raise_file_limit()
+    report = {
+        'python': platform.python_version(),
+        'file_limit': file_limit,
+        'results': asyncio.run(load_test(args.clients, args.games, args.strategy,
+                                         args.bot, address)),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    load_test_main()
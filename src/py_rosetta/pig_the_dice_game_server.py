@@ -0,0 +1,377 @@
+#! /usr/bin/python
+
+# pig_the_dice_game_server.py
+
+'''Pig the Dice Game, served
+
+Hosts games of Pig against the computer for many players at once, from a
+single asyncio process, over TCP or a Unix socket. The rules, strategies
+and goal are those of pig_the_dice_game; the computer's turns are played
+in-process by a registered strategy, paced by non-blocking timers rather
+than sleeps, so one slow player never holds up another.
+
+The protocol is lines of space-separated words. The server opens with
+
+    HELLO <goal>
+
+and the client answers PLAY, optionally naming the computer's strategy
+(`optimal` by default), or QUIT. During a game the server sends
+
+    TURN YOU|BOT          a turn begins; the human always moves first
+    ROLLED <n> <total>    a roll, and the turn total after it
+    ASK                   the client must answer ROLL or HOLD
+    BUST                  a 1 was rolled; the turn is over with no points
+    HOLD <total>          the turn is over and <total> is banked
+    SCORE <you> <bot>     the scores after each turn
+    WIN YOU|BOT           the game is over; the client may PLAY again
+
+and ERROR <reason> for anything it cannot accept. A session that sends
+nothing for IDLE_TIMEOUT seconds is closed.
+
+    python -m py_rosetta.pig_the_dice_game_server serve --port 8642
+    python -m py_rosetta.pig_the_dice_game_server play --port 8642
+'''
+import argparse
+import asyncio
+
+# Run as a script, this module has no package, so its neighbours are
+# imported as top-level modules from its directory.
+if __package__:
+    from .pig_the_dice_game import GOAL, STRATEGIES, load_optimal_policy, pig_roll, play_turn
+else:
+    from pig_the_dice_game import GOAL, STRATEGIES, load_optimal_policy, pig_roll, play_turn
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8642
+DEFAULT_BOT = 'optimal'
+# The pause between the computer's rolls, as in computer_round.
+BOT_DELAY = 1.0
+IDLE_TIMEOUT = 300.0
+
+
+class ProtocolError(Exception):
+    '''Raised when a client sends something the session cannot accept.'''
+
+
+class PigSession:
+    '''One connection: the stream pair, the computer's strategy, the scores
+       of the game in progress, the server's pacing and timeout, and the lines
+       waiting to be sent. Lines are sent together whenever the session waits,
+       on the client or on a timer, so a turn costs a write or two, not one per
+       line.'''
+
+    def __init__(self, reader, writer, bot_delay=BOT_DELAY, idle_timeout=IDLE_TIMEOUT):
+        self.reader = reader
+        self.writer = writer
+        self.bot_delay = bot_delay
+        self.idle_timeout = idle_timeout
+        self.bot = STRATEGIES[DEFAULT_BOT]
+        self.scores = [0, 0]
+        self.outgoing = []
+
+    def send(self, *words):
+        '''Queues one line made of `words` for the client. Returns None.'''
+        self.outgoing.append(' '.join(map(str, words)))
+
+    async def flush(self):
+        '''Writes the queued lines in one piece, and waits for the transport
+           to take them. Returns None.'''
+        if self.outgoing:
+            self.outgoing.append('')
+            self.writer.write('\n'.join(self.outgoing).encode())
+            self.outgoing.clear()
+        await self.writer.drain()
+
+    async def receive(self):
+        '''Flushes what has been sent, then waits for the next line.
+           Returns its words (list of str), the first upper-cased.
+           Raises ConnectionError if the client has gone, and ProtocolError
+           if the line is longer than the stream's limit.'''
+        await self.flush()
+        try:
+            line = await asyncio.wait_for(self.reader.readline(), self.idle_timeout)
+        except ValueError:
+            self.send('ERROR', "line too long")
+            await self.flush()
+            raise ProtocolError("line too long")
+        if not line:
+            raise ConnectionError("client closed the connection")
+        words = line.decode(errors='replace').split()
+        if words:
+            words[0] = words[0].upper()
+        return words
+
+    async def human_turn(self):
+        '''Plays the client's turn, by the rules of `play_turn`.
+           Returns the points won.'''
+        score = self.scores[0]
+        turn_total = 0
+        while True:
+            rolled = pig_roll()
+            if rolled == 1:
+                self.send('ROLLED', 1, 0)
+                self.send('BUST')
+                return 0
+            turn_total += rolled
+            self.send('ROLLED', rolled, turn_total)
+            if score + turn_total >= GOAL:
+                break
+            self.send('ASK')
+            while True:
+                words = await self.receive()
+                if words in (['ROLL'], ['HOLD']):
+                    break
+                self.send('ERROR', "expected ROLL or HOLD")
+            if words == ['HOLD']:
+                break
+        self.send('HOLD', turn_total)
+        return turn_total
+
+    async def bot_turn(self):
+        '''Plays the computer's turn with `play_turn`, then reports its rolls
+           one at a time. Returns the points won.'''
+        rolls = []
+        points = play_turn(self.scores[1], self.scores[0], self.bot,
+                           observer=lambda rolled, total: rolls.append((rolled, total)))
+        for (rolled, total) in rolls:
+            if self.bot_delay:
+                await self.flush()
+                await asyncio.sleep(self.bot_delay)
+            self.send('ROLLED', rolled, total)
+        if points:
+            self.send('HOLD', points)
+        else:
+            self.send('BUST')
+        return points
+
+    async def play_game(self):
+        '''Plays one game, the client first. Returns the index of the winner
+           (0 for the client, 1 for the computer).'''
+        self.scores = [0, 0]
+        player = 0
+        while True:
+            self.send('TURN', ('YOU', 'BOT')[player])
+            if player == 0:
+                points = await self.human_turn()
+            else:
+                points = await self.bot_turn()
+            self.scores[player] += points
+            self.send('SCORE', *self.scores)
+            if self.scores[player] >= GOAL:
+                self.send('WIN', ('YOU', 'BOT')[player])
+                return player
+            player = 1 - player
+
+    def choose_bot(self, words):
+        '''Sets the computer's strategy from the words of a PLAY line.
+           Raises ProtocolError for an unknown strategy.'''
+        name = words[1] if len(words) > 1 else DEFAULT_BOT
+        if name not in STRATEGIES:
+            raise ProtocolError(f"unknown strategy {name}")
+        self.bot = STRATEGIES[name]
+
+    async def run(self, played):
+        '''Greets the client and plays games until it quits.
+           Takes one arg: `played` (callable taking the winner's index, called
+           after every game). Returns None.'''
+        self.send('HELLO', GOAL)
+        while True:
+            words = await self.receive()
+            if words[:1] == ['QUIT']:
+                await self.flush()
+                return
+            if words[:1] != ['PLAY']:
+                self.send('ERROR', "expected PLAY or QUIT")
+                continue
+            try:
+                self.choose_bot(words)
+            except ProtocolError as error:
+                self.send('ERROR', error)
+                continue
+            played(await self.play_game())
+
+
+class PigServer:
+    '''Accepts connections and runs a PigSession for each, counting the
+       sessions open now, ever opened, and the games finished.'''
+
+    def __init__(self, bot_delay=BOT_DELAY, idle_timeout=IDLE_TIMEOUT):
+        self.bot_delay = bot_delay
+        self.idle_timeout = idle_timeout
+        self.active = 0
+        self.sessions = 0
+        self.games = 0
+        self.bot_wins = 0
+
+    def played(self, winner):
+        '''Counts a finished game won by `winner` (0 or 1). Returns None.'''
+        self.games += 1
+        self.bot_wins += winner
+
+    async def handle(self, reader, writer):
+        '''The connection callback for asyncio.start_server.'''
+        self.active += 1
+        self.sessions += 1
+        session = PigSession(reader, writer, self.bot_delay, self.idle_timeout)
+        try:
+            await session.run(self.played)
+        except (ConnectionError, asyncio.TimeoutError, ProtocolError):
+            pass
+        finally:
+            self.active -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+        '''Starts listening on `path` (a Unix socket) if given, and on `host`
+           and `port` otherwise. Returns the asyncio.Server.'''
+        # Load or solve the optimal policy before the first game needs it,
+        # not in the middle of the event loop's work.
+        load_optimal_policy(print)
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path, limit=1024, backlog=1024)
+        return await asyncio.start_server(self.handle, host, port, limit=1024, backlog=1024)
+
+
+async def open_pig_connection(host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+    '''Connects to a server the way `PigServer.start` listens.
+       Returns a (reader, writer) pair.'''
+    if path is not None:
+        return await asyncio.open_unix_connection(path)
+    return await asyncio.open_connection(host, port)
+
+
+async def play_remote(reader, writer, decide, bot=None, on_line=None):
+    '''Plays one game as the client.
+       Takes three args: the connection's `reader` and `writer`, and `decide`,
+       an async callable taking (score, opponent_score, turn_total) and
+       returning True to roll again; and optionally `bot` (str, the server
+       strategy to play against) and `on_line` (callable given each line the
+       server sends, as a list of words).
+       Returns the index of the winner (0 for this client, 1 for the server).
+       Expects HELLO to have been read already.'''
+    writer.write(b'PLAY\n' if bot is None else f"PLAY {bot}\n".encode())
+    await writer.drain()
+    scores = [0, 0]
+    turn_total = 0
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        words = line.decode().split()
+        if on_line is not None:
+            on_line(words)
+        match words:
+            case ['ROLLED', _, total]:
+                turn_total = int(total)
+            case ['SCORE', mine, theirs]:
+                scores = [int(mine), int(theirs)]
+            case ['ASK']:
+                keep_going = await decide(scores[0], scores[1], turn_total)
+                writer.write(b'ROLL\n' if keep_going else b'HOLD\n')
+                await writer.drain()
+            case ['WIN', who]:
+                return 0 if who == 'YOU' else 1
+            case ['ERROR', *reason]:
+                raise ConnectionError(' '.join(reason))
+
+
+def remote_strategy(strategy):
+    '''Takes one arg: `strategy` (strategy callable).
+       Returns it as a `decide` function for `play_remote`.'''
+    async def decide(score, opponent_score, turn_total):
+        return strategy(score, opponent_score, turn_total)
+    return decide
+
+
+async def ask_human(score, opponent_score, turn_total):
+    '''A `decide` function for `play_remote` that asks at the terminal,
+       without blocking the event loop.'''
+    loop = asyncio.get_running_loop()
+    while True:
+        response = (await loop.run_in_executor(None, input, "Roll again? (y/n) "))[:1]
+        match response:
+            case 'y':
+                return True
+            case 'n':
+                return False
+            case _:
+                print("Please enter y or n")
+
+
+def narrate(words):
+    '''Prints a line from the server as `human_round` and `computer_round`
+       would. Returns None.'''
+    match words:
+        case ['TURN', 'YOU']:
+            print("\nYour turn.")
+        case ['TURN', 'BOT']:
+            print("\nMy turn.")
+        case ['ROLLED', rolled, total] if rolled != '1':
+            print(f"Rolled {rolled}. {total} new points so far.")
+        case ['BUST']:
+            print("Rolled 1. Turn finished.")
+        case ['HOLD', total]:
+            print(f"Turn finished with {total} points.")
+        case ['SCORE', mine, theirs]:
+            print(f"You {mine}, me {theirs}.")
+        case ['WIN', 'YOU']:
+            print("\n\nYou won!")
+        case ['WIN', 'BOT']:
+            print("\n\nI won!")
+
+
+async def client_main(host=DEFAULT_HOST, port=DEFAULT_PORT, path=None, bot=None):
+    '''Plays games against a server at the terminal until the player stops.
+       Returns None.'''
+    reader, writer = await open_pig_connection(host, port, path)
+    await reader.readline()
+    try:
+        while True:
+            await play_remote(reader, writer, ask_human, bot, narrate)
+            if (input("Play again? (y/n) ")[:1]) != 'y':
+                break
+        writer.write(b'QUIT\n')
+        await writer.drain()
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    print("{:^36}".format("BYE!!!"))
+
+
+async def server_main(host=DEFAULT_HOST, port=DEFAULT_PORT, path=None, bot_delay=BOT_DELAY):
+    '''Serves until interrupted. Returns None.'''
+    server = PigServer(bot_delay)
+    listener = await server.start(host, port, path)
+    print(f"Serving Pig on {path or f'{host}:{port}'}")
+    async with listener:
+        await listener.serve_forever()
+
+
+def parse_args(argv=None):
+    '''Parses the command line (or `argv`, if given).
+       Returns an argparse.Namespace.'''
+    parser = argparse.ArgumentParser(description="Serve games of Pig, or play on a server.")
+    parser.add_argument('mode', choices=('serve', 'play'))
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', default=None, help="Unix socket path, instead of TCP")
+    parser.add_argument('--bot', choices=sorted(STRATEGIES), default=None,
+                        help="the computer's strategy (play only)")
+    parser.add_argument('--bot-delay', type=float, default=BOT_DELAY,
+                        help="seconds between the computer's rolls (serve only)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.mode == 'serve':
+        try:
+            asyncio.run(server_main(args.host, args.port, args.unix, args.bot_delay))
+        except KeyboardInterrupt:
+            pass
+    else:
+        asyncio.run(client_main(args.host, args.port, args.unix, args.bot))
@@ -0,0 +1,148 @@
+from array import array
+from math import isqrt
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from unittest import TestCase
+from ..src.py_rosetta.find_largest_left_truncatable_prime_in_a_given_base import (
+    sieve, jacobi, is_strong_probable_prime, is_strong_lucas_probable_prime, is_prime,
+    left_truncatable_prime_levels, largest_left_truncatable_prime, encode_varints,
+    decode_varints, checkpoint_path, save_checkpoint, load_checkpoint, BaseSearch,
+    search_bases_in_parallel)
+import os
+import unittest
+
+
+def is_prime_by_trial_division(n):
+    if n < 2:
+        return False
+    return all(n % d for d in range(2, isqrt(n) + 1))
+
+
+class TestPrimality(TestCase):
+
+    def test_sieve(self):
+        flags = sieve(1000)
+        self.assertEqual(len(flags), 1000)
+        for n in range(1000):
+            self.assertEqual(flags[n] == 1, is_prime_by_trial_division(n))
+
+    def test_jacobi(self):
+        # For an odd prime p, (a/p) is a**((p-1)/2) mod p (Euler's
+        # criterion), and the symbol is multiplicative in n.
+        primes = [p for p in range(3, 60) if is_prime_by_trial_division(p)]
+        for p in primes:
+            for a in range(-20, 3 * p):
+                euler = pow(a, (p - 1) // 2, p)
+                self.assertEqual(jacobi(a, p), -1 if euler == p - 1 else euler)
+        for p in primes:
+            for q in primes:
+                for a in range(30):
+                    self.assertEqual(jacobi(a, p * q), jacobi(a, p) * jacobi(a, q))
+
+    def test_is_prime_small(self):
+        for n in range(-10, 100_000):
+            self.assertEqual(is_prime(n), is_prime_by_trial_division(n), n)
+
+    def test_is_prime_near_sieve_limit(self):
+        for n in range(65_000, 70_000):
+            self.assertEqual(is_prime(n), is_prime_by_trial_division(n), n)
+
+    def test_strong_pseudoprimes(self):
+        # The smallest strong pseudoprimes to all prime bases up to 11, 13,
+        # 17, 23 and 37 respectively.
+        for n in (2152302898747, 3474749660383, 341550071728321,
+                  3825123056546413051, 318665857834031151167461):
+            self.assertTrue(is_strong_probable_prime(n, 2))
+            self.assertFalse(is_prime(n), n)
+
+    def test_strong_lucas_pseudoprimes(self):
+        # OEIS A217255: the odd composites below 10**5 that pass the
+        # strong Lucas test with Selfridge's parameters.
+        expected = [5459, 5777, 10877, 16109, 18971, 22499, 24569, 25199, 40309, 58519,
+                    75077, 97439]
+        found = [n for n in range(5, 100_000, 2)
+                 if isqrt(n) ** 2 != n and not is_prime_by_trial_division(n)
+                 and is_strong_lucas_probable_prime(n)]
+        self.assertEqual(found, expected)
+        for n in expected:
+            self.assertFalse(is_prime(n))
+
+    def test_mersenne_numbers(self):
+        for p in (31, 61, 89, 107, 127, 521, 607):
+            self.assertTrue(is_prime(2 ** p - 1), p)
+        for p in (29, 37, 67, 101, 257):
+            self.assertFalse(is_prime(2 ** p - 1), p)
+
+    def test_large_composites(self):
+        big_primes = [2 ** 61 - 1, 2 ** 89 - 1, 2 ** 127 - 1]
+        for p in big_primes:
+            for q in big_primes:
+                self.assertFalse(is_prime(p * q))
+        self.assertFalse(is_prime((2 ** 89 - 1) ** 2))
+
+
+class TestCheckpoints(TestCase):
+
+    def test_varint_round_trip(self):
+        values = [0, 1, 127, 128, 300, 2 ** 32, 2 ** 64 - 1, 2 ** 64, 2 ** 64 + 1, 3 ** 90]
+        encoded = encode_varints(reversed(values))
+        self.assertEqual(list(decode_varints(encoded, 0, len(values))), values)
+        self.assertEqual(len(encode_varints(range(100))), 100)
+
+    def test_checkpoint_round_trip(self):
+        with TemporaryDirectory() as directory:
+            path = checkpoint_path(directory, 7)
+            small = [2, 3, 5, 23, 1_000_003]
+            save_checkpoint(path, 7, 4, small)
+            base, level, frontier = load_checkpoint(path)
+            self.assertEqual((base, level), (7, 4))
+            self.assertIsInstance(frontier, array)
+            self.assertEqual(list(frontier), small)
+            large = [5, 2 ** 64 + 13, 7 ** 40]
+            save_checkpoint(path, 29, 41, large)
+            base, level, frontier = load_checkpoint(path)
+            self.assertEqual((base, level), (29, 41))
+            self.assertIsInstance(frontier, list)
+            self.assertEqual(frontier, large)
+
+    def test_resume(self):
+        for base in (5, 7, 10):
+            levels = list(left_truncatable_prime_levels(base))
+            middle = len(levels) // 2
+            with TemporaryDirectory() as directory:
+                save_checkpoint(checkpoint_path(directory, base), base, middle + 1,
+                                levels[middle])
+                [(found_base, largest, _)] = search_bases_in_parallel(
+                    [base], workers=1, checkpoint_dir=directory, resume=True)
+                self.assertEqual(found_base, base)
+                self.assertEqual(largest, largest_left_truncatable_prime(base))
+                self.assertFalse(os.path.exists(checkpoint_path(directory, base)))
+                [(_, cached, seconds)] = search_bases_in_parallel([base], checkpoint_dir=directory)
+                self.assertEqual((cached, seconds), (largest, 0.0))
+
+    def test_resume_wrong_base(self):
+        with TemporaryDirectory() as directory:
+            path = checkpoint_path(directory, 7)
+            save_checkpoint(path, 5, 2, [13, 17])
+            with self.assertRaises(ValueError):
+                BaseSearch(7, path, resume=True)
+
+
+class TestParallelSearch(TestCase):
+
+    def test_seconds(self):
+        # A base's seconds are its own chunks' time in the workers, so with
+        # one worker they add up to no more than the whole run.
+        start = perf_counter()
+        found = list(search_bases_in_parallel([3, 4, 10, 5], workers=1, chunk_size=50))
+        elapsed = perf_counter() - start
+        self.assertEqual(sorted(base for (base, _, _) in found), [3, 4, 5, 10])
+        for (base, largest, _) in found:
+            self.assertEqual(largest, largest_left_truncatable_prime(base))
+        seconds = {base: seconds for (base, _, seconds) in found}
+        self.assertGreater(seconds[10], seconds[3])
+        self.assertLess(sum(seconds.values()), elapsed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase, mock
+from ..src.py_rosetta.pig_the_dice_game import (GOAL, BlockDice, hold_at, play_game,
+                                                use_dice)
+from ..src.py_rosetta.pig_the_dice_game_server import (PigServer, open_pig_connection,
+                                                       play_remote, remote_strategy)
+import asyncio
+import os
+import sys
+import unittest
+
+
+class TestPigServer(TestCase):
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'pig.sock')
+        # Every test plays hold_at bots, so the optimal policy is never
+        # needed; don't solve it.
+        patcher = mock.patch.object(sys.modules[PigServer.__module__], 'load_optimal_policy')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(use_dice, None)
+
+    def serve(self, client, **options):
+        # Runs `client` (an async callable taking the server) against a
+        # server on a Unix socket, then waits for every session to end.
+        async def run():
+            server = PigServer(bot_delay=0, **options)
+            listener = await server.start(path=self.path)
+            try:
+                await client(server)
+                while server.active:
+                    await asyncio.sleep(0.01)
+            finally:
+                listener.close()
+                await listener.wait_closed()
+        asyncio.run(asyncio.wait_for(run(), 10))
+
+    async def connect(self):
+        reader, writer = await open_pig_connection(path=self.path)
+        self.assertEqual(await reader.readline(), f"HELLO {GOAL}\n".encode())
+        return reader, writer
+
+    async def exchange(self, reader, writer, line):
+        writer.write(line)
+        await writer.drain()
+        return await reader.readline()
+
+    def test_play_games(self):
+        # The server's game, with the client holding at 20 and the server
+        # at 25, must be the one play_game plays on the same dice.
+        games = 3
+        dice = BlockDice(11)
+        expected = [play_game(hold_at(20), hold_at(25), dice.roll) for _ in range(games)]
+        use_dice(BlockDice(11))
+        results = []
+
+        async def client(server):
+            reader, writer = await self.connect()
+            for _ in range(games):
+                lines = []
+                winner = await play_remote(reader, writer, remote_strategy(hold_at(20)),
+                                           'hold_at_25', lines.append)
+                scores = [[int(mine), int(theirs)] for (word, mine, theirs) in
+                          (words for words in lines if words[0] == 'SCORE')]
+                turns = sum(words[0] == 'TURN' for words in lines)
+                results.append((winner, scores[-1], turns))
+            writer.write(b'QUIT\n')
+            await writer.drain()
+            self.assertEqual(await reader.readline(), b'')
+            writer.close()
+            await writer.wait_closed()
+            self.assertEqual(server.sessions, 1)
+            self.assertEqual(server.games, games)
+            self.assertEqual(server.bot_wins, sum(winner for (winner, _, _) in expected))
+
+        self.serve(client)
+        self.assertEqual(results, expected)
+
+    def test_bad_requests(self):
+        async def client(server):
+            reader, writer = await self.connect()
+            self.assertEqual(await self.exchange(reader, writer, b'\n'),
+                             b'ERROR expected PLAY or QUIT\n')
+            self.assertEqual(await self.exchange(reader, writer, b'\xff\xfe\n'),
+                             b'ERROR expected PLAY or QUIT\n')
+            self.assertEqual(await self.exchange(reader, writer, b'PLAY nosuch\n'),
+                             b'ERROR unknown strategy nosuch\n')
+            with self.assertRaises(ConnectionError):
+                await play_remote(reader, writer, remote_strategy(hold_at(20)), 'nosuch')
+            # A move that is neither ROLL nor HOLD is refused, and the
+            # question stands.
+            use_dice(BlockDice(3))
+            writer.write(b'play hold_at_20\n')
+            while (line := await reader.readline()) != b'ASK\n':
+                self.assertNotEqual(line, b'')
+            self.assertEqual(await self.exchange(reader, writer, b'JUMP\n'),
+                             b'ERROR expected ROLL or HOLD\n')
+            self.assertEqual(await self.exchange(reader, writer, b'ROLL HOLD\n'),
+                             b'ERROR expected ROLL or HOLD\n')
+            self.assertTrue((await self.exchange(reader, writer, b'hold\n')).startswith(b'HOLD'))
+            writer.close()
+            await writer.wait_closed()
+
+        self.serve(client)
+
+    def test_line_too_long(self):
+        async def client(server):
+            reader, writer = await self.connect()
+            self.assertEqual(await self.exchange(reader, writer, b'PLAY ' + b'x' * 5000 + b'\n'),
+                             b'ERROR line too long\n')
+            self.assertEqual(await reader.readline(), b'')
+            writer.close()
+            await writer.wait_closed()
+
+        self.serve(client)
+
+    def test_idle_timeout(self):
+        async def client(server):
+            reader, writer = await self.connect()
+            self.assertEqual(server.active, 1)
+            self.assertEqual(await asyncio.wait_for(reader.readline(), 5), b'')
+            self.assertEqual(server.active, 0)
+            writer.close()
+            await writer.wait_closed()
+
+        self.serve(client, idle_timeout=0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,335 @@
+from functools import cache
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from ..src.py_rosetta.pig_the_dice_game import (GOAL, hold_at, play_turn, play_game,
+                                                simulate_games, BlockDice, GameRecorder,
+                                                read_game_log_header, read_game_log,
+                                                replay_game, game_log_stats,
+                                                TOURNAMENT_BATCH, wilson_interval, Match,
+                                                rank_strategies, run_tournament, solve_policy,
+                                                save_policy, load_policy, policy_strategy,
+                                                np, batch_hold_at, simulate_batch)
+import os
+import unittest
+import warnings
+
+
+def scripted(rolls):
+    return iter(rolls).__next__
+
+
+def always_roll(score, opponent_score, turn_total):
+    return True
+
+
+def never_asked(score, opponent_score, turn_total):
+    raise AssertionError("strategy consulted")
+
+
+class TestEngine(TestCase):
+
+    def test_play_turn_bust(self):
+        seen = []
+        points = play_turn(10, 20, always_roll, scripted([3, 4, 1, 6]),
+                           lambda roll, total: seen.append((roll, total)))
+        self.assertEqual(points, 0)
+        self.assertEqual(seen, [(3, 3), (4, 7), (1, 0)])
+
+    def test_play_turn_hold(self):
+        decisions = []
+
+        def strategy(score, opponent_score, turn_total):
+            decisions.append((score, opponent_score, turn_total))
+            return turn_total < 10
+        self.assertEqual(play_turn(10, 20, strategy, scripted([3, 4, 5, 1])), 12)
+        self.assertEqual(decisions, [(10, 20, 3), (10, 20, 7), (10, 20, 12)])
+
+    def test_play_turn_reaches_goal(self):
+        self.assertEqual(play_turn(GOAL - 8, 0, always_roll, scripted([2, 2, 6, 1])), 10)
+        self.assertEqual(play_turn(GOAL - 1, 0, never_asked, scripted([2])), 2)
+
+    def test_hold_at(self):
+        strategy = hold_at(20)
+        self.assertEqual(strategy.__name__, 'hold_at_20')
+        self.assertTrue(strategy(0, 0, 0))
+        self.assertTrue(strategy(50, 90, 19))
+        self.assertFalse(strategy(0, 0, 20))
+        self.assertFalse(strategy(0, 0, 25))
+        self.assertEqual(play_turn(0, 0, hold_at(10), scripted([6, 3, 2, 6])), 11)
+
+    def test_play_game(self):
+        # Every roll a 6 and every turn held at 6: the first mover wins
+        # on its 17th turn.
+        winner, scores, turns = play_game(hold_at(6), hold_at(6), lambda: 6)
+        self.assertEqual((winner, scores, turns), (0, [102, 96], 33))
+
+    def test_simulate_games_alternates(self):
+        # With every roll a 6 whoever moves first wins, so alternating
+        # splits the wins.
+        first, second = hold_at(6), hold_at(6)
+        self.assertEqual(simulate_games(first, second, 4, lambda: 6), [2, 2])
+        self.assertEqual(simulate_games(first, second, 5, lambda: 6), [3, 2])
+        self.assertEqual(simulate_games(first, second, 0, lambda: 6), [0, 0])
+
+
+class TestBlockDice(TestCase):
+
+    def test_faces(self):
+        dice = BlockDice(1)
+        rolls = [dice.roll() for _ in range(60_000)]
+        self.assertEqual(set(rolls), {1, 2, 3, 4, 5, 6})
+        for face in range(1, 7):
+            self.assertAlmostEqual(rolls.count(face) / len(rolls), 1 / 6, delta=0.01)
+        tosses = [dice.continue_round() for _ in range(40_000)]
+        self.assertAlmostEqual(sum(tosses) / len(tosses), 0.75, delta=0.015)
+
+    def test_tiny_blocks(self):
+        # With one byte per block, 4 bytes in 256 are rejected, so some
+        # refills come back empty and must be drawn again.
+        for seed in range(3):
+            dice = BlockDice(seed, block=1)
+            for _ in range(20_000):
+                self.assertIn(dice.roll(), range(1, 7))
+
+    def test_seed_and_snapshot(self):
+        self.assertEqual([BlockDice(5).roll() for _ in range(10)],
+                         [BlockDice(5).roll() for _ in range(10)])
+        dice = BlockDice(9, block=100)
+        for _ in range(150):
+            dice.roll()
+            dice.continue_round()
+        state = dice.snapshot()
+        before = [dice.roll() for _ in range(500)] + [dice.continue_round() for _ in range(500)]
+        dice.restore(state)
+        after = [dice.roll() for _ in range(500)] + [dice.continue_round() for _ in range(500)]
+        self.assertEqual(before, after)
+
+
+class TestGameLog(TestCase):
+
+    def test_record_and_replay(self):
+        first, second = hold_at(20), hold_at(25)
+        dice = BlockDice(2024)
+        start = dice.snapshot()
+        expected = []
+        for game in range(40):
+            if game % 2:
+                winner, scores, turns = play_game(second, first, dice.roll)
+                expected.append((1 - winner, scores[::-1], turns))
+            else:
+                expected.append(play_game(first, second, dice.roll))
+        dice.restore(start)
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'games.pig')
+            with open(path, 'wb') as out:
+                recorder = GameRecorder(out, ('hold_at_20', 'hold_at_25'))
+                wins = simulate_games(first, second, 40, dice.roll, recorder)
+                recorder.close()
+            self.assertEqual(recorder.games, 40)
+            self.assertEqual(read_game_log_header(path),
+                             {'goal': GOAL, 'names': ['hold_at_20', 'hold_at_25']})
+            games = list(read_game_log(path))
+            self.assertEqual([first_player for (first_player, _) in games], [0, 1] * 20)
+            replayed = [replay_game(*game) for game in games]
+            self.assertEqual([(winner, scores, len(turns)) for (winner, scores, turns) in replayed],
+                             expected)
+            self.assertEqual(wins, [sum(winner == player for (winner, _, _) in expected)
+                                    for player in (0, 1)])
+            stats = game_log_stats([path, path])
+            self.assertEqual(stats['games'], 80)
+            self.assertEqual(stats['holds'] + stats['busts'] + stats['games'], stats['turns'])
+            self.assertEqual(stats['turns'], 2 * sum(turns for (_, _, turns) in expected))
+            self.assertEqual(stats['wins'], {'hold_at_20': 2 * wins[0], 'hold_at_25': 2 * wins[1]})
+            self.assertEqual(sum(stats['faces']), stats['rolls'])
+
+
+@unittest.skipUnless(np, "simulate_batch needs NumPy")
+class TestBatchSimulator(TestCase):
+
+    def test_seed(self):
+        first, second = batch_hold_at(20), batch_hold_at(25)
+        one = simulate_batch(first, second, 2000, seed=5)
+        two = simulate_batch(first, second, 2000, seed=5, block=7)
+        other = simulate_batch(first, second, 2000, seed=6)
+        self.assertEqual(one['wins'], simulate_batch(first, second, 2000, seed=5)['wins'])
+        self.assertNotEqual(one['wins'], other['wins'])
+        for result in (one, two, other):
+            self.assertEqual(sum(result['wins']), 2000)
+            self.assertEqual(result['turns'].sum(), 2000)
+            self.assertAlmostEqual(result['mean_turns'],
+                                   (result['turns'] * np.arange(result['turns'].size)).sum() / 2000)
+
+    def test_matches_scalar_engine(self):
+        # Both engines play the same match, so their win rates and game
+        # lengths must agree to within sampling error.
+        games = 20_000
+        batch = simulate_batch(batch_hold_at(20), batch_hold_at(25), games, seed=1)
+        first, second = hold_at(20), hold_at(25)
+        dice = BlockDice(1)
+        wins = turns = 0
+        for game in range(games):
+            if game % 2:
+                winner, _, length = play_game(second, first, dice.roll)
+                winner = 1 - winner
+            else:
+                winner, _, length = play_game(first, second, dice.roll)
+            wins += winner == 0
+            turns += length
+        self.assertAlmostEqual(batch['win_rate'], wins / games, delta=0.025)
+        self.assertAlmostEqual(batch['mean_turns'], turns / games, delta=0.4)
+
+    def test_no_games(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            result = simulate_batch(batch_hold_at(20), batch_hold_at(25), 0, seed=1)
+        self.assertEqual(result['wins'], [0, 0])
+        self.assertEqual((result['win_rate'], result['mean_turns']), (0.0, 0.0))
+        self.assertEqual(result['turns'].sum(), 0)
+
+
+class TestPolicy(TestCase):
+
+    def test_goal_two(self):
+        # To reach 2 any roll but a 1 wins, so every turn starts with the
+        # same chance p of winning, where p = 5/6 + (1 - p)/6.
+        policy, win = solve_policy(2)
+        for row in win:
+            for value in row:
+                self.assertAlmostEqual(value, 6 / 7, places=10)
+        strategy = policy_strategy(policy, 2)
+        self.assertTrue(all(strategy(score, opponent_score, 0)
+                            for score in range(2) for opponent_score in range(2)))
+
+    def test_small_goal(self):
+        # Every decision must pick the better of rolling and holding,
+        # worked out here directly from the turn-start win probabilities.
+        goal = 15
+        policy, win = solve_policy(goal)
+        strategy = policy_strategy(policy, goal)
+
+        @cache
+        def value(score, opponent_score, turn_total):
+            if score + turn_total >= goal:
+                return 1.0
+            roll = (1 - win[opponent_score][score]
+                    + sum(value(score, opponent_score, turn_total + face)
+                          for face in range(2, 7))) / 6
+            if turn_total == 0:
+                return roll
+            return max(roll, 1 - win[opponent_score][score + turn_total])
+
+        for score in range(goal):
+            for opponent_score in range(goal):
+                self.assertAlmostEqual(win[score][opponent_score],
+                                       value(score, opponent_score, 0), places=9)
+                self.assertTrue(strategy(score, opponent_score, 0))
+                for turn_total in range(1, goal - score):
+                    roll = (1 - win[opponent_score][score]
+                            + sum(value(score, opponent_score, turn_total + face)
+                                  for face in range(2, 7))) / 6
+                    hold = 1 - win[opponent_score][score + turn_total]
+                    if abs(roll - hold) > 1e-9:
+                        self.assertEqual(strategy(score, opponent_score, turn_total), roll > hold)
+        # Moving first is an advantage, and a lead is worth having.
+        self.assertGreater(win[0][0], 0.5)
+        self.assertGreater(win[10][5], win[5][10])
+
+    def test_save_and_load(self):
+        policy, _ = solve_policy(20)
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'policy.bin')
+            save_policy(path, policy, 20)
+            goal, loaded = load_policy(path)
+            self.assertEqual(goal, 20)
+            self.assertEqual(bytes(loaded), bytes(policy))
+            solved, mapped = policy_strategy(policy, 20), policy_strategy(loaded, 20)
+            for score in range(20):
+                for opponent_score in range(20):
+                    for turn_total in range(20 - score):
+                        self.assertEqual(solved(score, opponent_score, turn_total),
+                                         mapped(score, opponent_score, turn_total))
+            with open(path, 'r+b') as out:
+                out.write(b'NOPE')
+            with self.assertRaises(ValueError):
+                load_policy(path)
+
+
+class TestTournament(TestCase):
+
+    def test_wilson_interval(self):
+        self.assertEqual(wilson_interval(0, 0), (0.0, 1.0))
+        low, high = wilson_interval(50, 100)
+        self.assertAlmostEqual(low, 0.4038, places=4)
+        self.assertAlmostEqual(high, 0.5962, places=4)
+        low, high = wilson_interval(0, 10)
+        self.assertAlmostEqual(low, 0.0)
+        self.assertAlmostEqual(high, 0.2775, places=4)
+        low, high = wilson_interval(10, 10)
+        self.assertAlmostEqual(low, 1 - 0.2775, places=4)
+        self.assertAlmostEqual(high, 1.0)
+        self.assertEqual(wilson_interval(30, 40, z=0), (0.75, 0.75))
+        for games in (10, 100, 1000):
+            low, high = wilson_interval(games // 3, games)
+            self.assertLess(low, 1 / 3)
+            self.assertGreater(high, 1 / 3)
+
+    def match(self, first, second, wins, games):
+        match = Match(first, second, 0)
+        match.wins, match.games = wins, games
+        return match
+
+    def test_rank_strategies(self):
+        matches = [self.match('a', 'b', 600, 1000),
+                   self.match('a', 'c', 900, 1000),
+                   self.match('b', 'c', 700, 1000),
+                   self.match('a', 'd', 0, 0)]
+        ranking = rank_strategies(['a', 'b', 'c', 'd'], matches)
+        self.assertEqual([name for (name, _, _) in ranking], ['a', 'b', 'c', 'd'])
+        rates = {name: rate for (name, rate, _) in ranking}
+        self.assertAlmostEqual(rates['a'], 0.75)
+        self.assertAlmostEqual(rates['b'], 0.55)
+        self.assertAlmostEqual(rates['c'], 0.2)
+        self.assertEqual(ranking[-1], ('d', 0.0, 0.0))
+        halves = {name: half for (name, _, half) in ranking}
+        expected = 1.959964 * (0.6 * 0.4 / 1000 + 0.3 * 0.7 / 1000) ** 0.5 / 2
+        self.assertAlmostEqual(halves['b'], expected)
+
+    def test_settled(self):
+        match = Match('a', 'b', 0)
+        self.assertFalse(match.settled(0.5, 1000))
+        self.assertEqual(match.next_batch(1000), TOURNAMENT_BATCH)
+        self.assertEqual(match.next_batch(100), 100)
+        match.outstanding = 900
+        self.assertFalse(match.settled(0.5, 1000))
+        self.assertEqual(match.next_batch(1000), 100)
+        match.outstanding = 1000
+        self.assertTrue(match.settled(0.5, 1000))
+        match.outstanding, match.games, match.wins = 0, 100, 50
+        self.assertFalse(match.settled(0.01, 1000))
+        self.assertTrue(match.settled(0.1, 1000))
+        self.assertTrue(match.settled(0.01, 100))
+
+    def test_run_tournament(self):
+        names = ['hold_at_20', 'hold_at_25']
+        for max_games in (100, 1200):
+            [match], ranking = run_tournament(names, workers=1, precision=0,
+                                              max_games=max_games, tournament_seed=7)
+            self.assertEqual(match.games, max_games)
+            self.assertEqual(match.outstanding, 0)
+            self.assertEqual(sorted(name for (name, _, _) in ranking), names)
+        again, _ = run_tournament(names, workers=1, precision=0, max_games=1200,
+                                  tournament_seed=7)
+        self.assertEqual(again[0].wins, match.wins)
+        # hold_at_20 and hold_at_25 are close: each wins 45-55% of games.
+        self.assertAlmostEqual(match.wins / match.games, 0.5, delta=0.05)
+        [match], _ = run_tournament(names, workers=1, precision=1, max_games=100_000,
+                                    tournament_seed=7)
+        self.assertLessEqual(match.games, 2 * TOURNAMENT_BATCH)
+        with self.assertRaises(ValueError):
+            run_tournament(['hold_at_20', 'hold_at_20'], workers=1)
+        with self.assertRaises(ValueError):
+            run_tournament(names, workers=1, max_games=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
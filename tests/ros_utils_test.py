@@ -1,7 +1,12 @@
+from collections import Counter
 from random import randrange
 from unittest import TestCase
-from ..tools.ros_utils import identity, index_or_none, BinaryHeap 
+from ..tools.ros_utils import (identity, index_or_none, BinaryHeap, NumericHeap, ExternalBinaryHeap,
+                               PairingHeap, nbest, merge, ConcurrentBinaryHeap, AsyncBinaryHeap)
+import asyncio
 import operator
+import queue
+import threading
 import unittest
 
 
@@ -251,11 +256,491 @@ class TestBinaryHeap(TestCase):
         heap = BinaryHeap(data, comp=operator.lt)
         results = []
         while not heap.is_empty():
-            results.append(heap.heappop)
+            results.append(heap.heappop())
 
         data = sorted(data)
         self.assertEqual(results, data)
-        
-        
+
+    def test_position_index(self):
+        heap = BinaryHeap()
+        for i in range(1000):
+            heap.heappush(randrange(-1000, 1001))
+        for i in range(RUNS_PER_TEST):
+            heap.heapdelete(randrange(-1000, 1001))
+            heap.heappushpop(randrange(-1000, 1001))
+            heap.heappop()
+        self.assertEqual(len(heap.heap), len(set(heap.heap)))
+        for (index, item) in enumerate(heap.heap):
+            self.assertEqual(heap.heapsearch(item), index)
+        self.assertIs(heap.heapsearch(5000), None)
+
+    def test_unhashable_items(self):
+        data = [[randrange(1000), randrange(1000)] for _ in range(MAX_DATA_SIZE)]
+        heap = BinaryHeap(data, comp=operator.lt, key=sum)
+        self.assertEqual(heap.heapsearch(data[0]), heap.heap.index(data[0]))
+        heap.heapdelete(data[0])
+        heap.heappush(data[1])
+        results = []
+        while not heap.is_empty():
+            results.append(sum(heap.heappop()))
+        unique = []
+        for item in data[1:]:
+            if item not in unique:
+                unique.append(item)
+        self.assertEqual(results, sorted(sum(item) for item in unique))
+
+    def test_duplicates_allowed(self):
+        data = [randrange(-100, 101) for _ in range(1000)]
+        heap = BinaryHeap(data, allow_duplicates=True)
+        self.assertEqual(heap.heaplen(), len(data))
+        heap.heapdelete(data[0])
+        data.remove(data[0])
+        results = []
+        while not heap.is_empty():
+            results.append(heap.heappop())
+        self.assertEqual(results, sorted(data, reverse=True))
+
+    def test_heappush_many(self):
+        for i in range(RUNS_PER_TEST):
+            heap = BinaryHeap(self.make_data_set())
+            data = set(heap.heap)
+            batch = self.make_data_set(n=randrange(1, 2 * MAX_DATA_SIZE))
+            heap.heappush_many(batch)
+            data.update(batch)
+            self.assertEqual(heap.heaplen(), len(data))
+            results = []
+            while not heap.is_empty():
+                results.append(heap.heappop())
+            self.assertEqual(results, sorted(data, reverse=True))
+
+    def test_heappop_n(self):
+        data = self.make_data_set(n=1000)
+        heap = BinaryHeap(data)
+        data = sorted(set(data), reverse=True)
+        self.assertEqual(heap.heappop_n(10), data[:10])
+        self.assertEqual(heap.heappop_n(0), [])
+        self.assertEqual(heap.heappop_n(len(data)), data[10:])
+        self.assertTrue(heap.is_empty())
+
+    def test_heapupdate(self):
+        priorities = {name: randrange(1000) for name in range(MAX_DATA_SIZE)}
+        heap = BinaryHeap([(p, name) for (name, p) in priorities.items()],
+                          comp=operator.lt, key=lambda pair: pair[0])
+        for i in range(1000):
+            name = randrange(MAX_DATA_SIZE)
+            new_priority = randrange(1000)
+            heap.heapupdate((priorities[name], name), (new_priority, name))
+            priorities[name] = new_priority
+        # Updating an item that is not in the heap does nothing.
+        heap.heapupdate((5000, 0), (0, 0))
+        results = []
+        while not heap.is_empty():
+            results.append(heap.heappop()[0])
+        self.assertEqual(results, sorted(priorities.values()))
+
+    def test_heapupdate_to_existing_item(self):
+        heap = BinaryHeap([1, 2, 3, 4, 5])
+        heap.heapupdate(2, 4)
+        self.assertEqual(heap.heappop_n(5), [5, 4, 3, 1])
+
+    def test_cache_keys(self):
+        calls = []
+        def counted_key(item):
+            calls.append(item)
+            return -item
+        data = list(set(self.make_data_set(n=1000)))
+        heap = BinaryHeap(data, key=counted_key, cache_keys=True)
+        for i in range(RUNS_PER_TEST):
+            pushed = randrange(-1_000_000, 1_000_001)
+            heap.heapdelete(pushed)
+            heap.heappushpop(pushed)
+        heap.heapupdate(heap.heappeek(), 2_000_000)
+        self.assertLess(len(calls), len(data) + 4 * RUNS_PER_TEST + 4)
+        self.assertEqual(heap._keys, [-item for item in heap.heap])
+        results = []
+        while not heap.is_empty():
+            results.append(heap.heappop())
+        self.assertEqual(results, sorted(results))
+
+    def test_heapq_path(self):
+        for comp in (operator.lt, operator.gt):
+            fast = BinaryHeap(comp=comp)
+            slow = BinaryHeap(comp=lambda a, b: comp(a, b))
+            self.assertIsNotNone(fast._heapq)
+            self.assertIsNone(slow._heapq)
+            for i in range(1000):
+                item = randrange(-500, 501)
+                match randrange(4):
+                    case 0:
+                        self.assertEqual(fast.heappushpop(item), slow.heappushpop(item))
+                    case 1:
+                        fast.heapdelete(item)
+                        slow.heapdelete(item)
+                    case _:
+                        fast.heappush(item)
+                        slow.heappush(item)
+                self.assertEqual(fast.heaplen(), slow.heaplen())
+                self.assertEqual(fast.heapsearch(item) is None, slow.heapsearch(item) is None)
+            self.assertEqual(fast.heappop_n(1000), slow.heappop_n(1000))
+
+    def test_heapq_path_index(self):
+        # Searches, deletes and updates on a heapq-path heap must use the
+        # position index, not scan the heap.
+        def no_scan(item):
+            raise AssertionError("heap was scanned")
+        for comp in (operator.lt, operator.gt):
+            heap = BinaryHeap(range(2000), comp=comp)
+            heap._scan = no_scan
+            for item in range(0, 2000, 4):
+                heap.heapupdate(item, item + 10_000)
+            for item in range(1, 2000, 4):
+                heap.heapdelete(item)
+            self.assertIsNone(heap.heapsearch(1))
+            self.assertEqual(heap.heap[heap.heapsearch(10_000)], 10_000)
+            expected = sorted([item for item in range(2000) if item % 4 > 1]
+                              + [item + 10_000 for item in range(0, 2000, 4)],
+                              reverse=comp is operator.gt)
+            self.assertEqual(heap.heappop_n(2000), expected)
+
+    def test_arity(self):
+        for arity in (2, 3, 4, 8):
+            data = self.make_data_set(n=1000)
+            heap = BinaryHeap(data, arity=arity)
+            for i in range(RUNS_PER_TEST):
+                heap.heapdelete(data[i])
+                heap.heappushpop(randrange(-1_000_000, 1_000_001))
+            for (index, item) in enumerate(heap.heap):
+                if index > 0:
+                    self.assertGreater(heap.heap[(index - 1) // arity], item)
+            results = []
+            while not heap.is_empty():
+                results.append(heap.heappop())
+            self.assertEqual(results, sorted(results, reverse=True))
+
+    def test_lazy_delete(self):
+        for allow_duplicates in (False, True):
+            for comp in (operator.gt, lambda a, b: a < b):
+                lazy = BinaryHeap(comp=comp, allow_duplicates=allow_duplicates,
+                                  lazy_delete=True, compact_fraction=0.25)
+                eager = BinaryHeap(comp=comp, allow_duplicates=allow_duplicates)
+                for i in range(2000):
+                    item = randrange(-200, 201)
+                    match randrange(5):
+                        case 0:
+                            self.assertEqual(lazy.heappushpop(item), eager.heappushpop(item))
+                        case 1 | 2:
+                            lazy.heapdelete(item)
+                            eager.heapdelete(item)
+                        case 3 if not eager.is_empty():
+                            self.assertEqual(lazy.heappeek(), eager.heappeek())
+                            self.assertEqual(lazy.heappop(), eager.heappop())
+                        case _:
+                            lazy.heappush(item)
+                            eager.heappush(item)
+                    self.assertEqual(lazy.heaplen(), eager.heaplen())
+                    self.assertEqual(lazy.heapsearch(item) is None, eager.heapsearch(item) is None)
+                    if allow_duplicates:
+                        self.assertEqual(lazy._copies, Counter(lazy.heap))
+                self.assertEqual(lazy.heappop_n(1000), eager.heappop_n(1000))
+                self.assertTrue(lazy.is_empty())
+
+    def test_lazy_delete_duplicates(self):
+        # With duplicates, a lazy delete must count copies, not scan the
+        # heap for them.
+        def no_scan(item):
+            raise AssertionError("heap was scanned")
+        for options in ({}, {'comp': operator.lt}, {'arity': 3, 'cache_keys': True}):
+            heap = BinaryHeap([item % 500 for item in range(2000)], allow_duplicates=True,
+                              lazy_delete=True, compact_fraction=0.9, **options)
+            heap._scan = no_scan
+            for item in range(0, 500, 2):
+                for _ in range(5):
+                    heap.heapdelete(item)
+            heap.heappush(0)
+            heap.heapdelete(1)
+            self.assertEqual(heap.heaplen(), 1000)
+            expected = [0, 1, 1, 1] + [item for item in range(3, 500, 2) for _ in range(4)]
+            expected.sort(reverse=options.get('comp') is not operator.lt)
+            self.assertEqual(heap.heappop_n(2000), expected)
+            self.assertEqual(heap._copies, Counter())
+
+    def test_lazy_delete_compaction(self):
+        heap = BinaryHeap(range(100), lazy_delete=True, compact_fraction=0.25)
+        for item in range(20):
+            heap.heapdelete(item)
+        self.assertEqual(len(heap.heap), 100)
+        for item in range(20, 30):
+            heap.heapdelete(item)
+        self.assertLess(len(heap.heap), 100)
+        self.assertEqual(heap.heaplen(), 70)
+        self.assertEqual(heap.heappop_n(100), list(range(99, 29, -1)))
+
+    def test_merge(self):
+        for i in range(RUNS_PER_TEST):
+            first = self.make_data_set()
+            second = self.make_data_set(n=randrange(10 * MAX_DATA_SIZE))
+            heap = BinaryHeap(first)
+            other = BinaryHeap(second, lazy_delete=True)
+            for item in second[:10]:
+                other.heapdelete(item)
+            heap.merge(other)
+            data = set(first) | (set(second) - set(second[:10]))
+            self.assertEqual(heap.heappop_n(len(data) + 1), sorted(data, reverse=True))
+
+    def test_instrument(self):
+        heap = BinaryHeap(range(1000))
+        fast_path = heap._heapq
+        timings = []
+        with heap.instrument(callback=lambda name, seconds: timings.append(name)) as stats:
+            heap.heappush(5000)
+            heap.heappush(-1)
+            heap.heappop_n(3)
+            heap.heapdelete(500)
+            heap.heapsearch(-5)
+        self.assertEqual(stats.calls, {'heappush': 2, 'heappop_n': 1, 'heappop': 3,
+                                       'heapdelete': 1, 'heapsearch': 2})
+        self.assertEqual(sorted(timings), sorted(name for name in stats.calls
+                                                 for _ in range(stats.calls[name])))
+        self.assertEqual(stats.sift_levels['heappush'], 9)
+        self.assertGreater(stats.sift_levels['heappop_n'], 20)
+        self.assertGreater(stats.comp_calls, 60)
+        self.assertGreater(stats.key_calls, 0)
+        self.assertEqual(stats.scanned, 0)
+        self.assertIs(heap._heapq, fast_path)
+        for name in ('heappush', 'heappop', '_sift_up', '_scan'):
+            self.assertNotIn(name, heap.__dict__)
+        self.assertEqual(heap.heappop_n(3), [997, 996, 995])
+
+        heap = BinaryHeap(range(100), allow_duplicates=True, comp=operator.lt, key=lambda x: -x)
+        with heap.instrument() as stats:
+            heap.heapsearch(90)
+            heap.heapsearch(1000)
+        self.assertEqual(stats.scanned, heap.heap.index(90) + 1 + 100)
+
+
+
+class TestNumericHeap(TestCase):
+
+    def test_heappop(self):
+        for comp in (operator.gt, operator.lt):
+            data = [randrange(-1000, 1001) for _ in range(1000)]
+            heap = NumericHeap(data, comp=comp, typecode='q')
+            for i in range(RUNS_PER_TEST):
+                pushed = randrange(-1000, 1001)
+                heap.heappush(pushed)
+                data.append(pushed)
+            self.assertEqual(heap.heaplen(), len(data))
+            results = []
+            while not heap.is_empty():
+                results.append(heap.heappop())
+            self.assertEqual(results, sorted(data, reverse=comp is operator.gt))
+
+    def test_payloads(self):
+        data = [(randrange(1000) / 7, n) for n in range(MAX_DATA_SIZE)]
+        heap = NumericHeap(data, comp=operator.lt, payload_typecode='q')
+        self.assertEqual(heap.heappeek()[0], min(data)[0])
+        self.assertEqual(heap.heappushpop(-1.0, -1), (-1.0, -1))
+        popped = heap.heappushpop(2000.0, MAX_DATA_SIZE)
+        self.assertEqual(popped[0], min(data)[0])
+        data.remove(popped)
+        data.append((2000.0, MAX_DATA_SIZE))
+        results = []
+        while not heap.is_empty():
+            results.append(heap.heappop())
+        self.assertEqual([priority for (priority, _) in results], sorted(p for (p, _) in data))
+        self.assertEqual(sorted(results), sorted(data))
+
+    def test_slots(self):
+        self.assertFalse(hasattr(NumericHeap(), '__dict__'))
+
+
+
+class TestExternalBinaryHeap(TestCase):
+
+    def test_heappop(self):
+        for comp in (operator.gt, operator.lt):
+            data = [randrange(-1000, 1001) for _ in range(1000)]
+            heap = ExternalBinaryHeap(data[:500], comp=comp, memory_budget=64)
+            for item in data[500:]:
+                heap.heappush(item)
+            self.assertEqual(heap.heaplen(), len(data))
+            self.assertLessEqual(heap._memory.heaplen(), 64)
+            expected = sorted(data, reverse=comp is operator.gt)[:500]
+            results = []
+            for i in range(500):
+                results.append(heap.heappop())
+            for item in data[:100]:
+                heap.heappush(item)
+            data.extend(data[:100])
+            while not heap.is_empty():
+                self.assertEqual(heap.heappeek(), heap.heappeek())
+                results.append(heap.heappop())
+            self.assertEqual(sorted(results), sorted(data))
+            self.assertEqual(results[:500], expected)
+            heap.close()
+
+    def test_key(self):
+        data = [(randrange(1000), str(n)) for n in range(1000)]
+        heap = ExternalBinaryHeap(data, comp=operator.lt, key=lambda pair: pair[0],
+                                  memory_budget=100)
+        results = []
+        while not heap.is_empty():
+            results.append(heap.heappop()[0])
+        self.assertEqual(results, sorted(pair[0] for pair in data))
+
+    def test_tied_keys(self):
+        heap = ExternalBinaryHeap([(5, 'a'), (5, 'b'), (5, 'c'), (1, 'd')],
+                                  key=lambda pair: pair[0], memory_budget=2)
+        results = [heap.heappop() for _ in range(4)]
+        self.assertEqual(sorted(results[:3]), [(5, 'a'), (5, 'b'), (5, 'c')])
+        self.assertEqual(results[3], (1, 'd'))
+        data = [(randrange(10), n) for n in range(500)]
+        heap = ExternalBinaryHeap(data, comp=operator.lt, key=lambda pair: pair[0],
+                                  memory_budget=16)
+        results = [heap.heappop() for _ in range(len(data))]
+        self.assertEqual(sorted(results), sorted(data))
+        self.assertEqual([pair[0] for pair in results], sorted(pair[0] for pair in data))
+
+    def test_max_runs(self):
+        # 2000 items with a budget of 4 spill 400 runs; no more than
+        # max_runs of them may be open at once.
+        for max_runs in (2, 5, 16):
+            data = [randrange(-1000, 1001) for _ in range(2000)]
+            heap = ExternalBinaryHeap(comp=operator.lt, memory_budget=4, max_runs=max_runs)
+            most_runs = 0
+            for item in data:
+                heap.heappush(item)
+                most_runs = max(most_runs, heap._heads.heaplen())
+            self.assertLessEqual(most_runs, max_runs)
+            self.assertEqual(heap.heaplen(), len(data))
+            results = [heap.heappop() for _ in range(1000)]
+            for item in data[:300]:
+                heap.heappush(item)
+            while not heap.is_empty():
+                results.append(heap.heappop())
+            self.assertEqual(results[:1000], sorted(data)[:1000])
+            self.assertEqual(sorted(results), sorted(data + data[:300]))
+        with self.assertRaises(AssertionError):
+            ExternalBinaryHeap(max_runs=1)
+
+
+class TestPairingHeap(TestCase):
+
+    def test_heappop(self):
+        for comp in (operator.gt, operator.lt):
+            data = [randrange(-1000, 1001) for _ in range(1000)]
+            heap = PairingHeap(data[:500], comp=comp)
+            for item in data[500:]:
+                heap.heappush(item)
+            self.assertEqual(heap.heaplen(), len(data))
+            results = []
+            while not heap.is_empty():
+                results.append(heap.heappop())
+            self.assertEqual(results, sorted(data, reverse=comp is operator.gt))
+        with self.assertRaises(AssertionError):
+            heap.heappop()
+
+    def test_heappushpop(self):
+        data = [randrange(-1000, 1001) for _ in range(MAX_DATA_SIZE)]
+        heap = PairingHeap(data, comp=operator.lt, key=abs)
+        self.assertEqual(heap.heappushpop(0), 0)
+        smallest = abs(heap.heappeek())
+        popped = heap.heappushpop(5000)
+        self.assertEqual(abs(popped), smallest)
+        self.assertEqual(heap.heaplen(), len(data))
+
+    def test_meld(self):
+        data = []
+        heaps = []
+        for i in range(RUNS_PER_TEST):
+            chunk = [randrange(-1000, 1001) for _ in range(randrange(MAX_DATA_SIZE))]
+            data.extend(chunk)
+            heaps.append(PairingHeap(chunk))
+        heap = PairingHeap()
+        for other in heaps:
+            heap.meld(other)
+            self.assertTrue(other.is_empty())
+        self.assertEqual(heap.heaplen(), len(data))
+        results = []
+        while not heap.is_empty():
+            results.append(heap.heappop())
+        self.assertEqual(results, sorted(data, reverse=True))
+
+
+class TestStreamingUtilities(TestCase):
+
+    def test_nbest(self):
+        for i in range(RUNS_PER_TEST):
+            data = [randrange(-1000, 1001) for _ in range(randrange(MAX_DATA_SIZE))]
+            k = randrange(MAX_DATA_SIZE)
+            self.assertEqual(list(nbest(data, k)), sorted(data, reverse=True)[:k])
+            self.assertEqual(list(nbest(iter(data), k, comp=operator.lt)), sorted(data)[:k])
+            best = list(nbest(data, k, comp=lambda a, b: a < b, key=abs))
+            self.assertEqual([abs(item) for item in best], sorted(map(abs, data))[:k])
+
+    def test_merge(self):
+        for i in range(RUNS_PER_TEST):
+            runs = [sorted(randrange(-1000, 1001) for _ in range(randrange(MAX_DATA_SIZE)))
+                    for _ in range(randrange(10))]
+            merged = list(merge(*runs, comp=operator.lt))
+            self.assertEqual(merged, sorted(item for run in runs for item in run))
+            descending = [run[::-1] for run in runs]
+            merged = list(merge(*map(iter, descending), key=lambda x: -x, comp=lambda a, b: a < b))
+            self.assertEqual(merged, sorted((item for run in runs for item in run), reverse=True))
+
+
+
+class TestConcurrentHeaps(TestCase):
+
+    def test_concurrent_binary_heap(self):
+        heap = ConcurrentBinaryHeap(maxsize=10, comp=operator.lt, allow_duplicates=True)
+        data = [randrange(1000) for _ in range(1000)]
+        chunks = [data[i::4] for i in range(4)]
+        producers = [threading.Thread(target=heap.put_many, args=(chunk,)) for chunk in chunks[:2]]
+        producers += [threading.Thread(target=lambda chunk=chunk: [heap.put(item) for item in chunk])
+                      for chunk in chunks[2:]]
+        for producer in producers:
+            producer.start()
+        results = []
+        while len(results) < len(data):
+            self.assertLessEqual(heap.qsize(), 10)
+            results.extend(heap.get_many(randrange(1, 5), timeout=5))
+        for producer in producers:
+            producer.join()
+        self.assertEqual(sorted(results), sorted(data))
+        with self.assertRaises(queue.Empty):
+            heap.get(timeout=0.01)
+        with self.assertRaises(queue.Empty):
+            heap.get_many(5, block=False)
+        heap.put_many(range(10))
+        self.assertTrue(heap.full())
+        with self.assertRaises(queue.Full):
+            heap.put(42, timeout=0.01)
+        self.assertEqual(heap.get_many(20), list(range(10)))
+
+    def test_async_binary_heap(self):
+        async def run():
+            heap = AsyncBinaryHeap(maxsize=10, allow_duplicates=True)
+            data = [randrange(1000) for _ in range(1000)]
+            async def produce(chunk):
+                for item in chunk:
+                    await heap.put(item)
+            producers = [asyncio.create_task(produce(data[i::4])) for i in range(3)]
+            producers.append(asyncio.create_task(heap.put_many(data[3::4])))
+            results = []
+            while len(results) < len(data):
+                self.assertLessEqual(heap.qsize(), 10)
+                results.extend(await heap.get_many(randrange(1, 5), timeout=5))
+            await asyncio.gather(*producers)
+            self.assertEqual(sorted(results), sorted(data))
+            with self.assertRaises(asyncio.QueueEmpty):
+                await heap.get(timeout=0.01)
+            await heap.put_many(range(10))
+            with self.assertRaises(asyncio.QueueFull):
+                await heap.put(42, timeout=0.01)
+            self.assertEqual(await heap.get(), 9)
+        asyncio.run(run())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,19 @@
 # ros_utils.py: Useful utilities for Rosetta Code problems
 
+import asyncio
+import heapq
+import mmap
 import operator
+import pickle
+import queue
+import struct
+import tempfile
+import threading
+from array import array
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from math import isqrt
+from time import perf_counter
 
 
 def identity(x):
@@ -20,124 +33,1133 @@ def index_or_none(item, iter):
 '''Binary Heap'''
 
 
+class HeapStats:
+    # Counters filled in by BinaryHeap.instrument(). calls, seconds and
+    # sift_levels are keyed by operation name; sift levels are charged
+    # to the outermost public operation that caused them.
+
+    def __init__(self):
+        self.comp_calls = 0
+        self.key_calls = 0
+        self.scanned = 0
+        self.calls = {}
+        self.seconds = {}
+        self.sift_levels = {}
+        self.operation = None
+
+
+# When a BinaryHeap orders its items directly with < or >, the C
+# functions in heapq can do its pushing, popping and heapifying.
+# The max-heap variants became public in Python 3.14.
+
+try:
+    from heapq import heapify_max, heappop_max, heappush_max, heapreplace_max
+except ImportError:
+    from heapq import _heapify_max as heapify_max
+    from heapq import _heappop_max as heappop_max
+    from heapq import _heapreplace_max as heapreplace_max
+    from heapq import _siftdown_max
+
+    def heappush_max(heap, item):
+        heap.append(item)
+        _siftdown_max(heap, 0, len(heap) - 1)
+
+
+HeapqOps = namedtuple('HeapqOps', ['push', 'pop', 'replace', 'heapify'])
+
+HEAPQ_OPS = {
+    operator.lt: HeapqOps(heapq.heappush, heapq.heappop, heapq.heapreplace, heapq.heapify),
+    operator.gt: HeapqOps(heappush_max, heappop_max, heapreplace_max, heapify_max),
+}
+
+
 class BinaryHeap:
-    def __init__(self, data_seq=None, *, comp=operator.gt, key=identity, allow_duplicates=False):
-        self.heap = []
+    def __init__(self, data_seq=None, *, comp=operator.gt, key=identity, allow_duplicates=False,
+                 cache_keys=False, arity=2, lazy_delete=False, compact_fraction=0.5):
+        assert arity >= 2, "BinaryHeap arity must be at least 2."
         self.comp = comp
         self.key = key
         self.allow_duplicates = allow_duplicates
+        self.cache_keys = cache_keys
+        self.arity = arity
+        self.lazy_delete = lazy_delete
+        self.compact_fraction = compact_fraction
+        if key is identity and not cache_keys and arity == 2:
+            self._heapq = HEAPQ_OPS.get(comp)
+        else:
+            self._heapq = None
+        self.heap = []
         if data_seq:
-            for item in data_seq:
-                self.heappush(item)
+            self.heappush_many(data_seq)
+
+    @property
+    def heap(self):
+        return self._heap
+
+    @heap.setter
+    def heap(self, data):
+        self._heap = data
+        self._reindex()
+
+    # With cache_keys, self._keys runs parallel to self.heap and holds
+    # key(item) for each slot, so key is called once per item rather
+    # than once per comparison. It is None otherwise.
+    #
+    # Without duplicates, every item has exactly one slot, so the
+    # self._positions dictionary (item -> index) gives O(1) searches.
+    # heapq cannot report the moves it makes, so a heap on the heapq
+    # path keeps only the set self._members for O(1) duplicate checks.
+    # The first search, delete or update on such a heap leaves the heapq
+    # path for good and builds self._positions in its place, so those
+    # stay O(1) and O(log n) for the heaps that use them.
+    # Both are None when duplicates are allowed, or once an unhashable
+    # item turns up; searches then fall back to a linear scan.
+    # A heap with both duplicates and lazy_delete counts the copies of
+    # each item in self._copies instead, so a lazy delete can tell in
+    # O(1) whether any copy of the item is still live. It is None
+    # otherwise, or once an unhashable item turns up.
+
+    def _reindex(self):
+        self._tombstones = {}
+        self._dead = 0
+        if self.cache_keys:
+            self._keys = [self.key(item) for item in self._heap]
+        else:
+            self._keys = None
+        self._reposition()
+
+    def _reposition(self):
+        self._positions = None
+        self._members = None
+        self._copies = None
+        if self.allow_duplicates:
+            if self.lazy_delete:
+                try:
+                    self._copies = Counter(self._heap)
+                except TypeError:
+                    pass
+            return
+        try:
+            if self._heapq is not None:
+                self._members = set(self._heap)
+            else:
+                positions = {}
+                for (index, item) in enumerate(self._heap):
+                    positions.setdefault(item, index)
+                self._positions = positions
+        except TypeError:
+            pass
+
+    def _track(self, item, index):
+        try:
+            if self._positions is not None:
+                self._positions[item] = index
+            elif self._members is not None:
+                self._members.add(item)
+            elif self._copies is not None:
+                self._copies[item] += 1
+        except TypeError:
+            self._positions = None
+            self._members = None
+            self._copies = None
+
+    def _untrack(self, item):
+        if self._positions is not None:
+            self._positions.pop(item, None)
+        elif self._members is not None:
+            self._members.discard(item)
+        elif self._copies is not None:
+            copies = self._copies[item] - 1
+            if copies:
+                self._copies[item] = copies
+            else:
+                del self._copies[item]
+
+    def _contains(self, item):
+        try:
+            if self._positions is not None:
+                return item in self._positions
+            if self._members is not None:
+                return item in self._members
+            if self._copies is not None:
+                return item in self._copies
+        except TypeError:
+            pass
+        return self._scan(item) is not None
+
+    def _append(self, item):
+        self._heap.append(item)
+        if self._keys is not None:
+            self._keys.append(self.key(item))
+        self._track(item, len(self._heap) - 1)
+
+    def _key_at(self, index):
+        if self._keys is not None:
+            return self._keys[index]
+        return self.key(self._heap[index])
+
+    # With lazy_delete, heapdelete only records the item in
+    # self._tombstones (item -> number of dead copies) and leaves it in
+    # place. Dead items are discarded when they reach the top, and the
+    # whole heap is compacted once more than compact_fraction of it is
+    # dead. self._dead is the total number of dead copies.
+
+    def _is_dead(self, item):
+        try:
+            return self._tombstones.get(item, 0) > 0
+        except TypeError:
+            return False
+
+    def _is_live(self, item):
+        if self._copies is not None:
+            return self._copies.get(item, 0) > self._tombstones.get(item, 0)
+        if not self._contains(item):
+            return False
+        if not self._dead:
+            return True
+        try:
+            dead = self._tombstones.get(item, 0)
+        except TypeError:
+            return True
+        if dead == 0:
+            return True
+        return self.allow_duplicates and self._heap.count(item) > dead
+
+    def _revive(self, item):
+        if self._is_dead(item):
+            self._bury(item, -1)
+            return True
+        return False
+
+    def _bury(self, item, count=1):
+        dead = self._tombstones.get(item, 0) + count
+        if dead:
+            self._tombstones[item] = dead
+        else:
+            del self._tombstones[item]
+        self._dead += count
+
+    def _purge_top(self):
+        while self._dead and self._is_dead(self._heap[0]):
+            self._bury(self._pop(), -1)
+
+    def _compact(self):
+        heap, keys = self._heap, self._keys
+        live, live_keys = [], []
+        for (index, item) in enumerate(heap):
+            if self._is_dead(item):
+                self._bury(item, -1)
+                continue
+            live.append(item)
+            if keys is not None:
+                live_keys.append(keys[index])
+        self._heap = live
+        if keys is not None:
+            self._keys = live_keys
+        self._reposition()
+        self._heapify()
 
     def is_empty(self):
-        return len(self.heap) == 0
+        return len(self._heap) == self._dead
 
     def heappush(self, item):
+        if self._dead and self._revive(item):
+            return
         if not self.allow_duplicates:
-            if self.heapsearch(item) is not None:
+            if self._contains(item):
                 return
-        self.heap.append(item)
+        if self._heapq is not None:
+            self._heapq.push(self._heap, item)
+            self._track(item, None)
+            return
+        self._append(item)
         self._sift_up()
 
+    def heappush_many(self, items):
+        heap = self._heap
+        old_len = len(heap)
+        for item in items:
+            if self._dead and self._revive(item):
+                continue
+            if not self.allow_duplicates:
+                if self._contains(item):
+                    continue
+            self._append(item)
+        new_len = len(heap)
+        # Sifting each new item up costs about log(n) apiece; rebuilding
+        # the whole heap bottom-up costs about n. Take the cheaper.
+        if (new_len - old_len) * new_len.bit_length() > new_len:
+            self._heapify()
+        else:
+            for index in range(old_len, new_len):
+                self._sift_up(index)
+
+    def merge(self, other):
+        if other._dead:
+            other._compact()
+        self.heappush_many(other.heap)
+
     def heappop(self):
         assert not self.is_empty(), \
           "Cannot pop from empty BinaryHeap."
-        item, self.heap[0] = self.heap[0], self.heap[-1]
-        self.heap.pop()
+        if self._dead:
+            self._purge_top()
+        return self._pop()
+
+    def _pop(self):
+        if self._heapq is not None:
+            item = self._heapq.pop(self._heap)
+            self._untrack(item)
+            return item
+        heap, keys = self._heap, self._keys
+        last = heap.pop()
+        if keys is not None:
+            last_key = keys.pop()
+        if not heap:
+            self._untrack(last)
+            return last
+        item, heap[0] = heap[0], last
+        if keys is not None:
+            keys[0] = last_key
+        self._untrack(item)
+        if self._positions is not None:
+            self._positions[last] = 0
         self._sift_down()
         return item
 
+    def heappop_n(self, n):
+        pop = self.heappop
+        return [pop() for _ in range(min(n, self.heaplen()))]
+
     def heaplen(self):
-        return len(self.heap)
+        return len(self._heap) - self._dead
 
     def heappeek(self):
         assert not self.is_empty(), \
           "Cannot peek into empty BinaryHeap."
-        return self.heap[0]
+        if self._dead:
+            self._purge_top()
+        return self._heap[0]
 
     def heappushpop(self, pushed):
         if self.is_empty():
             return pushed
-        top = self.heappeek()
-        if self.comp(self.key(top), self.key(pushed)):
-            if not self.allow_duplicates and pushed in self.heap:
+        if self._dead:
+            self._purge_top()
+        pushed_key = self.key(pushed)
+        if self.comp(self._key_at(0), pushed_key):
+            if self._dead and self._revive(pushed):
                 return self.heappop()
-            popped, self.heap[0] = self.heap[0], pushed
+            if not self.allow_duplicates and self._contains(pushed):
+                return self.heappop()
+            if self._heapq is not None:
+                popped = self._heapq.replace(self._heap, pushed)
+                self._untrack(popped)
+                self._track(pushed, None)
+                return popped
+            popped, self._heap[0] = self._heap[0], pushed
+            if self._keys is not None:
+                self._keys[0] = pushed_key
+            self._untrack(popped)
+            self._track(pushed, 0)
             self._sift_down()
             return popped
         return pushed
     
     def heapsearch(self, item):
-        return index_or_none(item, self.heap)
+        if self._members is not None:
+            self._heapq = None
+            self._reposition()
+        try:
+            if self._dead and not self._is_live(item):
+                return None
+            if self._positions is not None:
+                return self._positions.get(item)
+        except TypeError:
+            pass
+        return self._scan(item)
+
+    def _scan(self, item):
+        return index_or_none(item, self._heap)
 
     def heapdelete(self, item):
-        pivot_index = self.heapsearch(item)
-        if pivot_index is not None:
-            swapped = self.heap[-1]
-            self.heap[pivot_index], self.heap[-1] = swapped, item
-            self.heap.pop()
-            if self.comp(self.key(swapped), self.key(item)):
-                self._sift_up(pivot_index)
-            elif self.comp(self.key(item), self.key(swapped)):
-                self._sift_down(pivot_index)
-            else:
+        if self.lazy_delete:
+            try:
+                hash(item)
+            except TypeError:
                 pass
+            else:
+                if self._is_live(item):
+                    self._bury(item)
+                    if self._dead > self.compact_fraction * len(self._heap):
+                        self._compact()
+                return
+        pivot_index = self.heapsearch(item)
+        if pivot_index is None:
+            return
+        heap, keys = self._heap, self._keys
+        swapped = heap.pop()
+        if keys is not None:
+            swapped_key = keys.pop()
         else:
-            pass
-                
+            swapped_key = self.key(swapped)
+        # The last item leaves its slot here, and _replace puts it back
+        # in the pivot's.
+        self._untrack(swapped)
+        if pivot_index == len(heap):
+            return
+        self._replace(pivot_index, swapped, swapped_key)
+
+    def heapupdate(self, item, new_item):
+        index = self.heapsearch(item)
+        if index is None:
+            return
+        if not self.allow_duplicates and new_item != item:
+            if self._dead:
+                self._revive(new_item)
+            if self._contains(new_item):
+                self.heapdelete(item)
+                return
+        self._replace(index, new_item, self.key(new_item))
+
+    def _replace(self, index, new_item, new_key):
+        heap, keys = self._heap, self._keys
+        old_key = self._key_at(index)
+        old_item, heap[index] = heap[index], new_item
+        if keys is not None:
+            keys[index] = new_key
+        self._untrack(old_item)
+        self._track(new_item, index)
+        if self.comp(new_key, old_key):
+            self._sift_up(index)
+        elif self.comp(old_key, new_key):
+            self._sift_down(index)
+
+    # instrument() swaps counting wrappers into this one instance for the
+    # duration of a with block, and swaps the originals back afterwards,
+    # so an uninstrumented heap runs exactly the code above. The heapq
+    # path is switched off meanwhile, since it bypasses comp and key.
+
+    INSTRUMENTED_OPERATIONS = ('heappush', 'heappush_many', 'heappop', 'heappop_n', 'heappushpop',
+                               'heapsearch', 'heapdelete', 'heapupdate', 'merge')
+
+    @contextmanager
+    def instrument(self, callback=None):
+        stats = HeapStats()
+        comp, key, heapq_ops = self.comp, self.key, self._heapq
+
+        def counted_comp(a, b):
+            stats.comp_calls += 1
+            return comp(a, b)
+
+        def counted_key(item):
+            stats.key_calls += 1
+            return key(item)
+
+        def counted_scan(item, scan=self._scan):
+            index = scan(item)
+            stats.scanned += len(self._heap) if index is None else index + 1
+            return index
+
+        def counted_sift(name, sift):
+            def wrapper(index=None):
+                if index is None:
+                    index = len(self._heap) - 1 if name == '_sift_up' else 0
+                end = sift(index)
+                if end is not None and end != index:
+                    levels = self._levels_between(min(index, end), max(index, end))
+                    operation = stats.operation or name
+                    stats.sift_levels[operation] = stats.sift_levels.get(operation, 0) + levels
+                return end
+            return wrapper
+
+        def timed(name, method):
+            def wrapper(*args):
+                outermost = stats.operation is None
+                if outermost:
+                    stats.operation = name
+                start = perf_counter()
+                try:
+                    return method(*args)
+                finally:
+                    elapsed = perf_counter() - start
+                    if outermost:
+                        stats.operation = None
+                    stats.calls[name] = stats.calls.get(name, 0) + 1
+                    stats.seconds[name] = stats.seconds.get(name, 0.0) + elapsed
+                    if callback is not None:
+                        callback(name, elapsed)
+            return wrapper
+
+        wrappers = {'_scan': counted_scan,
+                    '_sift_up': counted_sift('_sift_up', self._sift_up),
+                    '_sift_down': counted_sift('_sift_down', self._sift_down)}
+        for name in self.INSTRUMENTED_OPERATIONS:
+            wrappers[name] = timed(name, getattr(self, name))
+        self.comp, self.key, self._heapq = counted_comp, counted_key, None
+        self._reposition()
+        self.__dict__.update(wrappers)
+        try:
+            yield stats
+        finally:
+            for name in wrappers:
+                del self.__dict__[name]
+            self.comp, self.key, self._heapq = comp, key, heapq_ops
+            self._reposition()
+
+    def _levels_between(self, upper_index, lower_index):
+        levels = 0
+        while lower_index > upper_index:
+            lower_index = (lower_index - 1) // self.arity
+            levels += 1
+        return levels
+
+    def _heapify(self):
+        if self._heapq is not None:
+            self._heapq.heapify(self._heap)
+            return
+        for index in range((len(self._heap) - 2) // self.arity, -1, -1):
+            self._sift_down(index)
+
+    # Both sifts carry the moving item in a "hole" and write it once at
+    # its final slot, so its key is computed a single time and only the
+    # items that actually move need their index entries updated.
+    # The children of slot i are slots arity*i + 1 to arity*i + arity.
+    # Each returns the slot where the item came to rest.
+
     def _sift_up(self, index=None):
-        heap_len = len(self.heap)
+        heap = self._heap
+        heap_len = len(heap)
         if heap_len < 2 or (index is not None and index >= heap_len):
-            return
+            return index
         if index is None:
             cur_index = heap_len - 1
         else:
             cur_index = index
-        item = self.heap[cur_index]
+        comp, key, keys, positions = self.comp, self.key, self._keys, self._positions
+        arity = self.arity
+        item = heap[cur_index]
+        item_key = keys[cur_index] if keys is not None else key(item)
         while cur_index > 0:
-            parent_index = (cur_index - 1) // 2
-            parent = self.heap[parent_index]
-            if self.comp(self.key(item), self.key(parent)):
-                self.heap[parent_index], self.heap[cur_index] = item, parent
-                cur_index = parent_index
-            else:
-                return
+            parent_index = (cur_index - 1) // arity
+            parent = heap[parent_index]
+            parent_key = keys[parent_index] if keys is not None else key(parent)
+            if not comp(item_key, parent_key):
+                break
+            heap[cur_index] = parent
+            if keys is not None:
+                keys[cur_index] = parent_key
+            if positions is not None:
+                positions[parent] = cur_index
+            cur_index = parent_index
+        heap[cur_index] = item
+        if keys is not None:
+            keys[cur_index] = item_key
+        if positions is not None:
+            positions[item] = cur_index
+        return cur_index
 
     def _sift_down(self, index=0):
-        heap_len = len(self.heap)
+        heap = self._heap
+        heap_len = len(heap)
         if heap_len < 2 or index >= heap_len:
-            return
+            return index
+        comp, key, keys, positions = self.comp, self.key, self._keys, self._positions
+        arity = self.arity
         cur_index = index
-        item = self.heap[cur_index]
+        item = heap[cur_index]
+        item_key = keys[cur_index] if keys is not None else key(item)
         while True:
-            left_index = 2 * cur_index + 1
-            right_index = left_index + 1
-            if left_index >= heap_len:
-                return
+            child_index = arity * cur_index + 1
+            if child_index >= heap_len:
+                break
+            child = heap[child_index]
+            child_key = keys[child_index] if keys is not None else key(child)
+            for other_index in range(child_index + 1, min(child_index + arity, heap_len)):
+                other = heap[other_index]
+                other_key = keys[other_index] if keys is not None else key(other)
+                if comp(other_key, child_key):
+                    child_index, child, child_key = other_index, other, other_key
+            if not comp(child_key, item_key):
+                break
+            heap[cur_index] = child
+            if keys is not None:
+                keys[cur_index] = child_key
+            if positions is not None:
+                positions[child] = cur_index
+            cur_index = child_index
+        heap[cur_index] = item
+        if keys is not None:
+            keys[cur_index] = item_key
+        if positions is not None:
+            positions[item] = cur_index
+        return cur_index
+
+
+'''Numeric Heap'''
+
+
+class NumericHeap:
+    # A heap of plain numbers kept in an array rather than a list, so each
+    # entry costs 8 bytes instead of a pointer plus a boxed int or float.
+    # An optional second array carries a numeric payload (an id, say)
+    # alongside each priority. Duplicate priorities are always allowed.
+
+    __slots__ = ('comp', 'heap', 'payloads')
+
+    def __init__(self, data_seq=None, *, comp=operator.gt, typecode='d', payload_typecode=None):
+        self.comp = comp
+        self.heap = array(typecode)
+        if payload_typecode is None:
+            self.payloads = None
+        else:
+            self.payloads = array(payload_typecode)
+        if data_seq:
+            if self.payloads is None:
+                self.heap.extend(data_seq)
+            else:
+                for (priority, payload) in data_seq:
+                    self.heap.append(priority)
+                    self.payloads.append(payload)
+            for index in range((len(self.heap) - 2) // 2, -1, -1):
+                self._sift_down(index)
+
+    def is_empty(self):
+        return len(self.heap) == 0
+
+    def heaplen(self):
+        return len(self.heap)
+
+    def _entry(self, index):
+        if self.payloads is None:
+            return self.heap[index]
+        return self.heap[index], self.payloads[index]
+
+    def heappush(self, priority, payload=None):
+        self.heap.append(priority)
+        if self.payloads is not None:
+            self.payloads.append(payload)
+        self._sift_up(len(self.heap) - 1)
+
+    def heappop(self):
+        assert not self.is_empty(), \
+          "Cannot pop from empty NumericHeap."
+        entry = self._entry(0)
+        heap, payloads = self.heap, self.payloads
+        last = heap.pop()
+        if payloads is not None:
+            last_payload = payloads.pop()
+        if heap:
+            heap[0] = last
+            if payloads is not None:
+                payloads[0] = last_payload
+            self._sift_down(0)
+        return entry
+
+    def heappeek(self):
+        assert not self.is_empty(), \
+          "Cannot peek into empty NumericHeap."
+        return self._entry(0)
+
+    def heappushpop(self, priority, payload=None):
+        if self.is_empty() or not self.comp(self.heap[0], priority):
+            if self.payloads is None:
+                return priority
+            return priority, payload
+        entry = self._entry(0)
+        self.heap[0] = priority
+        if self.payloads is not None:
+            self.payloads[0] = payload
+        self._sift_down(0)
+        return entry
+
+    def _sift_up(self, index):
+        heap, payloads, comp = self.heap, self.payloads, self.comp
+        item = heap[index]
+        if payloads is not None:
+            payload = payloads[index]
+        while index > 0:
+            parent_index = (index - 1) // 2
+            parent = heap[parent_index]
+            if not comp(item, parent):
+                break
+            heap[index] = parent
+            if payloads is not None:
+                payloads[index] = payloads[parent_index]
+            index = parent_index
+        heap[index] = item
+        if payloads is not None:
+            payloads[index] = payload
+
+    def _sift_down(self, index):
+        heap, payloads, comp = self.heap, self.payloads, self.comp
+        heap_len = len(heap)
+        item = heap[index]
+        if payloads is not None:
+            payload = payloads[index]
+        while True:
+            child_index = 2 * index + 1
+            if child_index >= heap_len:
+                break
+            child = heap[child_index]
+            right_index = child_index + 1
             if right_index < heap_len:
-                left_child = self.heap[left_index]
-                right_child = self.heap[right_index]
-                if self.comp(self.key(left_child), self.key(right_child)):
-                    better_child = left_child
-                    better_index = left_index
-                    worse_child = right_child
-                    worse_index = right_index
+                right_child = heap[right_index]
+                if comp(right_child, child):
+                    child_index, child = right_index, right_child
+            if not comp(child, item):
+                break
+            heap[index] = child
+            if payloads is not None:
+                payloads[index] = payloads[child_index]
+            index = child_index
+        heap[index] = item
+        if payloads is not None:
+            payloads[index] = payload
+
+
+'''External Heap'''
+
+
+RECORD_HEADER = struct.Struct('<I')
+
+
+class SpilledRun:
+    # A sorted run of pickled items in a temporary file, read back
+    # through a memory map one record at a time. The map keeps its own
+    # handle on the file, so the file itself is closed once written.
+    # A run's level is how many merges its items have been through.
+
+    __slots__ = ('buffer', 'offset', 'remaining', 'level')
+
+    def __init__(self, items, level=0):
+        self.level = level
+        self.remaining = 0
+        with tempfile.TemporaryFile() as file:
+            for item in items:
+                record = pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+                file.write(RECORD_HEADER.pack(len(record)))
+                file.write(record)
+                self.remaining += 1
+            file.flush()
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offset = 0
+
+    def next_item(self):
+        (length,) = RECORD_HEADER.unpack_from(self.buffer, self.offset)
+        start = self.offset + RECORD_HEADER.size
+        self.offset = start + length
+        self.remaining -= 1
+        return pickle.loads(self.buffer[start:self.offset])
+
+    def close(self):
+        self.buffer.close()
+
+
+class ExternalBinaryHeap:
+    # A priority queue that may outgrow memory. Items go into an in-memory
+    # BinaryHeap; when it holds more than memory_budget items, they are
+    # written out in order as a SpilledRun. A pop compares the top of the
+    # in-memory heap with the head of every run (kept in a second, small
+    # heap) and takes the best, so runs are merged lazily. Every run holds
+    # a file open, so runs are also merged on disk, fan_in at a time:
+    # whenever fan_in runs share a level they become one run of the next
+    # level, so an item is rewritten about log(n / memory_budget, fan_in)
+    # times. Should that still leave more than max_runs runs, the
+    # smallest fan_in are merged as well, so the open files stay bounded
+    # however far the heap outgrows memory. Items must be picklable, and
+    # duplicates are always allowed.
+
+    def __init__(self, data_seq=None, *, comp=operator.gt, key=identity, memory_budget=100_000,
+                 max_runs=64):
+        assert memory_budget > 0, "ExternalBinaryHeap memory_budget must be positive."
+        assert max_runs >= 2, "ExternalBinaryHeap max_runs must be at least 2."
+        self.comp = comp
+        self.key = key
+        self.memory_budget = memory_budget
+        self.max_runs = max_runs
+        self.fan_in = max(2, isqrt(max_runs))
+        self._memory = BinaryHeap(comp=comp, key=key, allow_duplicates=True)
+        self._heads = self._new_heads()
+        self._spilled = 0
+        if data_seq:
+            for item in data_seq:
+                self.heappush(item)
+
+    def is_empty(self):
+        return self.heaplen() == 0
+
+    def heaplen(self):
+        return self._memory.heaplen() + self._spilled
+
+    def heappush(self, item):
+        self._memory.heappush(item)
+        if self._memory.heaplen() > self.memory_budget:
+            self._spill()
+
+    def _new_heads(self, heads=None):
+        # A heap of (head item, run) pairs, one for each open run.
+        key = self.key
+        return BinaryHeap(heads, comp=self.comp, key=lambda head: key(head[0]),
+                          allow_duplicates=True, cache_keys=True)
+
+    def _spill(self):
+        items = self._memory.heappop_n(self._memory.heaplen())
+        run = SpilledRun(items)
+        self._spilled += run.remaining
+        self._heads.heappush((run.next_item(), run))
+        level = 0
+        while True:
+            heads = [head for head in self._heads.heap if head[1].level == level]
+            if len(heads) < self.fan_in:
+                break
+            self._merge_runs(heads, level + 1)
+            level += 1
+        if self._heads.heaplen() > self.max_runs:
+            heads = sorted(self._heads.heap, key=lambda head: head[1].remaining)[:self.fan_in]
+            self._merge_runs(heads, max(run.level for (_, run) in heads) + 1)
+
+    def _merge_runs(self, heads, level):
+        merged = {id(run) for (_, run) in heads}
+        run = SpilledRun(self._drain(self._new_heads(heads)), level)
+        self._heads = self._new_heads([head for head in self._heads.heap
+                                       if id(head[1]) not in merged])
+        self._heads.heappush((run.next_item(), run))
+
+    def _drain(self, heads):
+        while not heads.is_empty():
+            yield self._advance(heads)
+
+    def _advance(self, heads):
+        # heappushpop would hand back the new head, not the old one, if
+        # their keys tie, so the run is always popped and pushed again.
+        (item, run) = heads.heappop()
+        if run.remaining:
+            heads.heappush((run.next_item(), run))
+        else:
+            run.close()
+        return item
+
+    def _next_from_runs(self):
+        self._spilled -= 1
+        return self._advance(self._heads)
+
+    def _memory_is_better(self):
+        if self._heads.is_empty():
+            return True
+        if self._memory.is_empty():
+            return False
+        return self.comp(self.key(self._memory.heappeek()), self.key(self._heads.heappeek()[0]))
+
+    def heappeek(self):
+        assert not self.is_empty(), \
+          "Cannot peek into empty ExternalBinaryHeap."
+        if self._memory_is_better():
+            return self._memory.heappeek()
+        return self._heads.heappeek()[0]
+
+    def heappop(self):
+        assert not self.is_empty(), \
+          "Cannot pop from empty ExternalBinaryHeap."
+        if self._memory_is_better():
+            return self._memory.heappop()
+        return self._next_from_runs()
+
+    def close(self):
+        while not self._heads.is_empty():
+            self._heads.heappop()[1].close()
+        self._memory = BinaryHeap(comp=self.comp, key=self.key, allow_duplicates=True)
+        self._spilled = 0
+
+
+'''Pairing Heap'''
+
+
+class PairingNode:
+    __slots__ = ('key', 'item', 'children')
+
+    def __init__(self, key, item):
+        self.key = key
+        self.item = item
+        self.children = []
+
+
+class PairingHeap:
+    # A heap-ordered tree in which any node may have any number of
+    # children. Two heaps meld in O(1) by making the lesser root a child
+    # of the greater; pops pay for the restructuring, in amortized
+    # O(log n). comp and key rank items as in BinaryHeap; duplicates
+    # are always allowed.
+
+    def __init__(self, data_seq=None, *, comp=operator.gt, key=identity):
+        self.comp = comp
+        self.key = key
+        self._root = None
+        self._len = 0
+        if data_seq:
+            for item in data_seq:
+                self.heappush(item)
+
+    def _link(self, first, second):
+        if self.comp(second.key, first.key):
+            first, second = second, first
+        first.children.append(second)
+        return first
+
+    def is_empty(self):
+        return self._root is None
+
+    def heaplen(self):
+        return self._len
+
+    def heappush(self, item):
+        node = PairingNode(self.key(item), item)
+        if self._root is None:
+            self._root = node
+        else:
+            self._root = self._link(self._root, node)
+        self._len += 1
+
+    def heappeek(self):
+        assert not self.is_empty(), \
+          "Cannot peek into empty PairingHeap."
+        return self._root.item
+
+    def heappop(self):
+        assert not self.is_empty(), \
+          "Cannot pop from empty PairingHeap."
+        root = self._root
+        children = root.children
+        # Link the children in pairs from left to right, then fold the
+        # pairs together from right to left.
+        paired = [self._link(children[index], children[index + 1])
+                  for index in range(0, len(children) - 1, 2)]
+        if len(children) % 2:
+            paired.append(children[-1])
+        new_root = paired.pop() if paired else None
+        while paired:
+            new_root = self._link(paired.pop(), new_root)
+        self._root = new_root
+        self._len -= 1
+        return root.item
+
+    def heappushpop(self, pushed):
+        if self.is_empty() or not self.comp(self._root.key, self.key(pushed)):
+            return pushed
+        popped = self.heappop()
+        self.heappush(pushed)
+        return popped
+
+    def meld(self, other):
+        assert self.comp is other.comp and self.key is other.key, \
+          "Cannot meld PairingHeaps with different comp or key."
+        if other._root is not None:
+            if self._root is None:
+                self._root = other._root
+            else:
+                self._root = self._link(self._root, other._root)
+            self._len += other._len
+        other._root = None
+        other._len = 0
+
+
+'''Streaming Heap Utilities'''
+
+
+REVERSED_COMPS = {operator.gt: operator.lt, operator.lt: operator.gt}
+
+
+def reversed_comp(comp):
+    '''Given a comparison function, return one that ranks items the other way round.'''
+    if comp in REVERSED_COMPS:
+        return REVERSED_COMPS[comp]
+    return lambda a, b: comp(b, a)
+
+
+def nbest(iterable, k, *, comp=operator.gt, key=identity):
+    '''Given an iterable and a count k, yield the k best items of iterable, best first,
+       where comp and key rank items as they do in BinaryHeap. Only k items are held
+       in memory at once.'''
+    if k <= 0:
+        return
+    # The worst of the k best so far sits at the top of this heap, so
+    # each new item only has to beat it.
+    kept = BinaryHeap(comp=reversed_comp(comp), key=key, allow_duplicates=True)
+    items = iter(iterable)
+    for item in items:
+        kept.heappush(item)
+        if kept.heaplen() == k:
+            break
+    for item in items:
+        kept.heappushpop(item)
+    for item in reversed(kept.heappop_n(k)):
+        yield item
+
+
+def merge(*sorted_iterables, comp=operator.gt, key=identity):
+    '''Given iterables that are each already sorted best first under comp and key,
+       lazily yield all of their items as one sorted stream. Holds one item per
+       iterable in memory.'''
+    heap = BinaryHeap(comp=comp, key=lambda entry: key(entry[0]), allow_duplicates=True,
+                      cache_keys=True)
+    for iterable in sorted_iterables:
+        items = iter(iterable)
+        try:
+            heap.heappush((next(items), items))
+        except StopIteration:
+            pass
+    while not heap.is_empty():
+        (item, items) = heap.heappop()
+        while True:
+            yield item
+            try:
+                next_item = next(items)
+            except StopIteration:
+                break
+            (item, items) = heap.heappushpop((next_item, items))
+
+
+'''Concurrent Heaps'''
+
+
+class ConcurrentBinaryHeap:
+    # A BinaryHeap shared between threads, with the blocking put/get of
+    # queue.Queue. Both conditions share one lock, which is held only for
+    # the heap operation itself; waiters are woken only when an item or
+    # a free slot actually appears. A maxsize <= 0 means no bound.
+
+    def __init__(self, data_seq=None, *, maxsize=0, **heap_options):
+        self.heap = BinaryHeap(data_seq, **heap_options)
+        self.maxsize = maxsize
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.not_full = threading.Condition(self.mutex)
+
+    def _has_items(self):
+        return not self.heap.is_empty()
+
+    def _has_room(self):
+        return self.maxsize <= 0 or self.heap.heaplen() < self.maxsize
+
+    def _wait(self, condition, predicate, block, timeout, exception):
+        if not block:
+            if not predicate():
+                raise exception
+        elif not condition.wait_for(predicate, timeout):
+            raise exception
+
+    def qsize(self):
+        with self.mutex:
+            return self.heap.heaplen()
+
+    def empty(self):
+        with self.mutex:
+            return not self._has_items()
+
+    def full(self):
+        with self.mutex:
+            return not self._has_room()
+
+    def put(self, item, block=True, timeout=None):
+        with self.not_full:
+            self._wait(self.not_full, self._has_room, block, timeout, queue.Full)
+            self.heap.heappush(item)
+            self.not_empty.notify()
+
+    def get(self, block=True, timeout=None):
+        with self.not_empty:
+            self._wait(self.not_empty, self._has_items, block, timeout, queue.Empty)
+            item = self.heap.heappop()
+            self.not_full.notify()
+            return item
+
+    def put_many(self, items, block=True, timeout=None):
+        items = list(items)
+        while items:
+            with self.not_full:
+                self._wait(self.not_full, self._has_room, block, timeout, queue.Full)
+                if self.maxsize <= 0:
+                    count = len(items)
                 else:
-                    better_child = right_child
-                    better_index = right_index
-                    worse_child = left_child
-                    worse_index = left_index
-                if self.comp(self.key(better_child), self.key(item)):
-                    self.heap[cur_index], self.heap[better_index] = better_child, item
-                    cur_index = better_index
-                elif self.comp(self.key(worse_child), self.key(item)):
-                    self.heap[cur_index], self.heap[worse_index] = worse_child, item
-                    cur_index = worse_index
+                    count = self.maxsize - self.heap.heaplen()
+                self.heap.heappush_many(items[:count])
+                self.not_empty.notify(count)
+            del items[:count]
+
+    def get_many(self, n, block=True, timeout=None):
+        with self.not_empty:
+            self._wait(self.not_empty, self._has_items, block, timeout, queue.Empty)
+            items = self.heap.heappop_n(n)
+            self.not_full.notify(len(items))
+            return items
+
+
+class AsyncBinaryHeap:
+    # The asyncio counterpart of ConcurrentBinaryHeap. Timeouts raise
+    # asyncio.QueueFull or asyncio.QueueEmpty.
+
+    def __init__(self, data_seq=None, *, maxsize=0, **heap_options):
+        self.heap = BinaryHeap(data_seq, **heap_options)
+        self.maxsize = maxsize
+        self.mutex = asyncio.Lock()
+        self.not_empty = asyncio.Condition(self.mutex)
+        self.not_full = asyncio.Condition(self.mutex)
+
+    def _has_items(self):
+        return not self.heap.is_empty()
+
+    def _has_room(self):
+        return self.maxsize <= 0 or self.heap.heaplen() < self.maxsize
+
+    async def _wait(self, condition, predicate, timeout, exception):
+        if predicate():
+            return
+        if timeout is None:
+            await condition.wait_for(predicate)
+            return
+        try:
+            await asyncio.wait_for(condition.wait_for(predicate), timeout)
+        except asyncio.TimeoutError:
+            raise exception from None
+
+    def qsize(self):
+        return self.heap.heaplen()
+
+    def empty(self):
+        return not self._has_items()
+
+    def full(self):
+        return not self._has_room()
+
+    async def put(self, item, timeout=None):
+        async with self.not_full:
+            await self._wait(self.not_full, self._has_room, timeout, asyncio.QueueFull)
+            self.heap.heappush(item)
+            self.not_empty.notify()
+
+    async def get(self, timeout=None):
+        async with self.not_empty:
+            await self._wait(self.not_empty, self._has_items, timeout, asyncio.QueueEmpty)
+            item = self.heap.heappop()
+            self.not_full.notify()
+            return item
+
+    async def put_many(self, items, timeout=None):
+        items = list(items)
+        while items:
+            async with self.not_full:
+                await self._wait(self.not_full, self._has_room, timeout, asyncio.QueueFull)
+                if self.maxsize <= 0:
+                    count = len(items)
                 else:
-                    return
-            else:
-                child = self.heap[left_index]
-                if self.comp(self.key(child), self.key(item)):
-                    self.heap[cur_index], self.heap[left_index] = child, item
-                return
+                    count = self.maxsize - self.heap.heaplen()
+                self.heap.heappush_many(items[:count])
+                self.not_empty.notify(count)
+            del items[:count]
+
+    async def get_many(self, n, timeout=None):
+        async with self.not_empty:
+            await self._wait(self.not_empty, self._has_items, timeout, asyncio.QueueEmpty)
+            items = self.heap.heappop_n(n)
+            self.not_full.notify(len(items))
+            return items
@@ -0,0 +1,209 @@
+# ros_utils_bench.py: Benchmarks for the data structures in ros_utils
+
+'''Times BinaryHeap operations over a range of sizes, alongside the same work
+done with the standard library's heapq as a reference, and writes the results
+as JSON so that runs from different releases can be compared.
+
+    python tools/ros_utils_bench.py --sizes 1000 10000 --output bench.json
+'''
+
+import argparse
+import heapq
+import json
+import operator
+import platform
+import sys
+from random import Random
+from time import perf_counter
+
+from ros_utils import BinaryHeap
+
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+DEFAULT_REPEAT = 3
+# Searches and deletes each scan or reorganize the heap, so only this
+# many are timed per size rather than n of them.
+LOOKUPS = 100
+
+# Each variant is a set of BinaryHeap options, keyed by the name that
+# appears in the results. "custom" variants defeat the heapq fast path.
+
+VARIANTS = {
+    'default': {},
+    'duplicates': {'allow_duplicates': True},
+    'custom_comp': {'comp': lambda a, b: a > b},
+    'custom_key': {'comp': operator.lt, 'key': lambda x: -x},
+    'cached_key': {'comp': operator.lt, 'key': lambda x: -x, 'cache_keys': True},
+}
+
+
+def best_time(setup, run, repeat):
+    '''Given a setup function, a function of the value setup returns, and a repeat
+       count, return the fastest of repeat timings of run (in seconds). Setup is
+       not timed.'''
+    best = None
+    for _ in range(repeat):
+        state = setup()
+        start = perf_counter()
+        run(state)
+        elapsed = perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_binary_heap(options, data, lookups, fresh, repeated, repeat):
+    '''Given BinaryHeap options, a list of distinct ints, a list of items from it,
+       a list of ints not in it that sort below all of it, the ints with some
+       repeated, and a repeat count, return a dict mapping each operation to its
+       best time.'''
+    def build():
+        return BinaryHeap(data, **options)
+
+    def push_all(heap):
+        for item in data:
+            heap.heappush(item)
+
+    def pop_all(heap):
+        while not heap.is_empty():
+            heap.heappop()
+
+    def pushpop_all(heap):
+        for item in fresh:
+            heap.heappushpop(item)
+
+    def search_all(heap):
+        for item in lookups:
+            heap.heapsearch(item)
+
+    def delete_all(heap):
+        for item in lookups:
+            heap.heapdelete(item)
+
+    return {
+        'construct': best_time(lambda: None, lambda _: build(), repeat),
+        'construct_repeated': best_time(lambda: None,
+                                        lambda _: BinaryHeap(repeated, **options), repeat),
+        'push': best_time(lambda: BinaryHeap(**options), push_all, repeat),
+        'pop': best_time(build, pop_all, repeat),
+        'pushpop': best_time(build, pushpop_all, repeat),
+        'search': best_time(build, search_all, repeat),
+        'delete': best_time(build, delete_all, repeat),
+    }
+
+
+def bench_heapq(data, lookups, fresh, repeated, repeat):
+    '''Given a list of distinct ints, a list of items from it, a list of ints
+       not in it that sort above all of it, the ints with some repeated, and a
+       repeat count, return a dict mapping each operation to its best time with
+       heapq, on a min-heap of the same items.'''
+    def build(items=data):
+        heap = list(items)
+        heapq.heapify(heap)
+        return heap
+
+    def push_all(heap):
+        for item in data:
+            heapq.heappush(heap, item)
+
+    def pop_all(heap):
+        while heap:
+            heapq.heappop(heap)
+
+    def pushpop_all(heap):
+        for item in fresh:
+            heapq.heappushpop(heap, item)
+
+    def search_all(heap):
+        for item in lookups:
+            heap.index(item)
+
+    def delete_all(heap):
+        for item in lookups:
+            index = heap.index(item)
+            last = heap.pop()
+            if index < len(heap):
+                heap[index] = last
+                heapq._siftup(heap, index)
+                heapq._siftdown(heap, 0, index)
+
+    return {
+        'construct': best_time(lambda: None, lambda _: build(), repeat),
+        'construct_repeated': best_time(lambda: None, lambda _: build(repeated), repeat),
+        'push': best_time(list, push_all, repeat),
+        'pop': best_time(build, pop_all, repeat),
+        'pushpop': best_time(build, pushpop_all, repeat),
+        'search': best_time(build, search_all, repeat),
+        'delete': best_time(build, delete_all, repeat),
+    }
+
+
+def run_benchmarks(sizes, repeat, variants, seed=0):
+    '''Given a sequence of sizes, a repeat count and a sequence of variant names,
+       return a list of result records, one per size, implementation and
+       operation.'''
+    rng = Random(seed)
+    results = []
+    for n in sizes:
+        data = rng.sample(range(n * 10), n)
+        lookups = rng.sample(data, min(LOOKUPS, n))
+        # pushpop pushes values that are new to the heap and beat none of
+        # its items, so every call replaces the top and sifts it down:
+        # below the data for the BinaryHeap variants, which all put the
+        # largest on top, and above it for heapq's min-heap.
+        low = [-1 - i for i in range(n)]
+        high = [n * 10 + i for i in range(n)]
+        # About a third of the items given to construct_repeated are
+        # copies, which heaps without allow_duplicates must drop.
+        repeated = data + rng.sample(data, n // 2)
+        rng.shuffle(repeated)
+        timings = {'heapq': bench_heapq(data, lookups, high, repeated, repeat)}
+        for name in variants:
+            timings[name] = bench_binary_heap(VARIANTS[name], data, lookups, low, repeated,
+                                              repeat)
+        for (implementation, operations) in timings.items():
+            for (operation, seconds) in operations.items():
+                results.append({
+                    'n': n,
+                    'implementation': implementation,
+                    'operation': operation,
+                    'seconds': seconds,
+                    'relative_to_heapq': seconds / timings['heapq'][operation],
+                })
+        print(f"n={n} done", file=sys.stderr)
+    return results
+
+
+def parse_args(argv=None):
+    '''Parses the command line (or argv, if given). Returns an argparse.Namespace.'''
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--variants', nargs='+', choices=sorted(VARIANTS), default=list(VARIANTS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="file for the JSON results (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def bench_main(argv=None):
+    '''Runs the benchmarks selected on the command line and writes the JSON report.'''
+    args = parse_args(argv)
+    report = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'sizes': args.sizes,
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'results': run_benchmarks(args.sizes, args.repeat, args.variants, args.seed),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    bench_main()